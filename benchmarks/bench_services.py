@@ -0,0 +1,238 @@
+"""
+Micro-benchmarks for the allocation and lookup paths of the services.
+
+Drives CIDRService and SubnetService directly against synthetic occupied
+lists of increasing size and different fragmentation patterns - no server,
+git remote or network involved. Latency and memory are printed as a table
+and written to a JSON file, so results can be compared between versions.
+
+Usage:
+    python benchmarks/bench_services.py
+    python benchmarks/bench_services.py --sizes 1000 10000 --patterns packed fragmented
+    python benchmarks/bench_services.py --output results/before.json
+
+The file name deliberately does not match test_*.py, so the test runner
+never picks it up.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR / "server"))
+
+# Local settings only - the services must not need a GitHub repository
+os.environ.setdefault("storage_backend", "sqlite")
+os.environ.setdefault("sqlite_path", os.path.join(tempfile.mkdtemp(prefix="cidr-bench-"), "occupied.db"))
+os.environ.setdefault("log_level", "WARNING")
+
+from services import CIDRService, SubnetService  # noqa: E402
+from state import OccupiedSnapshot, format_cidr  # noqa: E402
+import vectorized  # noqa: E402
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+PATTERNS = ["packed", "fragmented", "random", "mixed"]
+
+# Every synthetic entry lives in the 10.0.0.0/8 range
+RANGE_KEY = "10"
+RANGE_START = 10 << 24
+RANGE_SIZE = 1 << 24
+
+def generate_occupied(size: int, pattern: str, seed: int = 0) -> Dict[str, str]:
+    """
+    Synthetic occupied list of the given size.
+
+    packed: /30s back to back from the start of the range
+    fragmented: /30s with a /30 hole after each - nothing larger than a /30
+        is free until past the last entry
+    random: /30s at random aligned positions across the range
+    mixed: /26 to /30 networks allocated back to back with every fifth one
+        deleted again, leaving holes of mixed sizes like long-lived usage
+    """
+    rng = random.Random(seed)
+    timestamp = 1_700_000_000
+    if pattern == "packed":
+        starts = [(RANGE_START + i * 4, 30) for i in range(size)]
+    elif pattern == "fragmented":
+        starts = [(RANGE_START + i * 8, 30) for i in range(size)]
+    elif pattern == "random":
+        starts = [(RANGE_START + slot * 4, 30) for slot in rng.sample(range(RANGE_SIZE // 4), size)]
+    elif pattern == "mixed":
+        starts = []
+        position = RANGE_START
+        for i, prefix in enumerate(rng.choices([26, 28, 29, 30], weights=[2, 20, 40, 80], k=size * 5 // 4)):
+            block = 1 << (32 - prefix)
+            position = (position + block - 1) // block * block
+            if i % 5 != 4:
+                starts.append((position, prefix))
+            position += block
+    else:
+        raise ValueError(f"Unknown pattern: {pattern}")
+
+    return {f"bench-{i}-{timestamp + i}": format_cidr(start, prefix) for i, (start, prefix) in enumerate(starts)}
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds."""
+    ordered = sorted(samples)
+
+    def at(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 4)
+
+    return {
+        "runs": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 4),
+        "p50_ms": at(0.50),
+        "p95_ms": at(0.95),
+        "max_ms": round(ordered[-1] * 1000, 4)
+    }
+
+def _time(func: Callable[[], Any], runs: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return _percentiles(samples)
+
+def _time_once(func: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    func()
+    return round((time.perf_counter() - start) * 1000, 4)
+
+def bench_snapshot(service: CIDRService, occupied: Dict[str, str], runs: int) -> Dict[str, Any]:
+    """Parse, memory, allocation, reason and overlap benchmarks on one occupied list."""
+    results: Dict[str, Any] = {}
+
+    # Parsing the occupied file contents into a snapshot, as on every new commit
+    gc.collect()
+    start = time.perf_counter()
+    snapshot = OccupiedSnapshot(occupied)
+    results["load_ms"] = round((time.perf_counter() - start) * 1000, 4)
+    del snapshot
+
+    gc.collect()
+    tracemalloc.start()
+    snapshot = OccupiedSnapshot(occupied)
+    snapshot.index
+    results["snapshot_bytes"], results["snapshot_peak_bytes"] = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Reason lookups - the first call builds the reason index
+    keys = list(occupied)
+    reasons = [key.rsplit('-', 1)[0] for key in random.Random(1).sample(keys, min(runs, len(keys)))]
+    results["reason_index_build_ms"] = _time_once(lambda: service._check_reason_already_used("missing", snapshot))
+    hits = iter(reasons * (runs // len(reasons) + 1))
+    results["reason_hit"] = _time(lambda: service._check_reason_already_used(next(hits), snapshot), runs)
+    results["reason_miss"] = _time(lambda: service._check_reason_already_used("missing", snapshot), runs)
+
+    # Overlap checks of random candidates anywhere in the range
+    rng = random.Random(2)
+    candidates = iter([format_cidr(RANGE_START + rng.randrange(RANGE_SIZE // 256) * 256, 24) for _ in range(runs)])
+    results["overlap_check"] = _time(lambda: service._check_cidr_overlap(next(candidates), snapshot), runs)
+
+    # Allocations as a mutation applies them: find the next free subnet and add it
+    counter = iter(range(10 ** 9))
+    for allocator_mode in ("index", "buddy"):
+        service.settings = service.settings.model_copy(update={"allocator_mode": allocator_mode})
+        for subnet_size in (28, 24):
+            allocation_snapshot = OccupiedSnapshot(occupied)
+
+            def allocate():
+                subnet = service._get_next_available_subnet(RANGE_KEY, subnet_size, allocation_snapshot)
+                allocation_snapshot.add(f"alloc-{next(counter)}", str(subnet))
+
+            # The first allocation builds the interval index (and buddy free lists)
+            name = f"allocate_{allocator_mode}_{subnet_size}"
+            try:
+                results[f"{name}_first_ms"] = _time_once(allocate)
+                results[name] = _time(allocate, runs)
+            except Exception as e:
+                # The range ran out of space
+                results[name] = {"error": str(e)}
+
+    return results
+
+def bench_subnets(runs: int) -> Dict[str, Any]:
+    """Subnet expansion benchmarks, which do not depend on the occupied list."""
+    subnet_service = SubnetService()
+    cases = {
+        "subnets_24_to_28": (28, "10.0.0.0/24", 0, None),
+        "subnets_16_to_24": (24, "10.0.0.0/16", 0, None),
+        "subnets_8_to_24": (24, "10.0.0.0/8", 0, None),
+        "subnets_8_to_30_page": (30, "10.0.0.0/8", 1_000_000, 10_000)
+    }
+    return {
+        name: _time(lambda args=args: subnet_service.get_subnets_from_cidr(*args), max(1, runs // 10))
+        for name, args in cases.items()
+    }
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "-C", str(REPO_DIR), "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark CIDR allocation and lookups on synthetic occupied lists.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Occupied list sizes")
+    parser.add_argument("--patterns", nargs="+", choices=PATTERNS, default=PATTERNS, help="Fragmentation patterns")
+    parser.add_argument("--runs", type=int, default=200, help="Timed runs per operation")
+    parser.add_argument("--output", help="JSON results file (default: benchmarks/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    service = CIDRService()
+    started = datetime.now(timezone.utc)
+    report: Dict[str, Any] = {
+        "started": started.isoformat(),
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": vectorized.available(),
+        "runs": args.runs,
+        "scenarios": [],
+        "subnets": bench_subnets(args.runs)
+    }
+
+    def p50(summary: Dict[str, Any]) -> str:
+        return f"{summary['p50_ms']:.4f}" if "p50_ms" in summary else "failed"
+
+    print(f"{'size':>9} {'pattern':<11} {'load ms':>9} {'MiB':>7} {'reason p50':>11} {'overlap p50':>12} "
+          f"{'alloc/28 p50':>13} {'alloc/24 p50':>13} {'buddy/24 p50':>13}")
+    for size in args.sizes:
+        for pattern in args.patterns:
+            occupied = generate_occupied(size, pattern)
+            results = bench_snapshot(service, occupied, args.runs)
+            report["scenarios"].append({"size": size, "pattern": pattern, **results})
+            print(f"{size:>9} {pattern:<11} {results['load_ms']:>9.1f} {results['snapshot_bytes'] / 2 ** 20:>7.1f} "
+                  f"{p50(results['reason_hit']):>11} {p50(results['overlap_check']):>12} "
+                  f"{p50(results['allocate_index_28']):>13} {p50(results['allocate_index_24']):>13} "
+                  f"{p50(results['allocate_buddy_24']):>13}")
+
+    for name, summary in report["subnets"].items():
+        print(f"{name:<22} p50 {summary['p50_ms']:.3f} ms")
+
+    output = Path(args.output) if args.output else (
+        REPO_DIR / "benchmarks" / "results" / f"{started.strftime('%Y%m%dT%H%M%SZ')}-{report['revision']}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=4))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Hermetic end-to-end load test of the API server.
+
+Creates a bare git repository on the local file system as the occupied
+repository, starts one or more server/main.py processes against it (each
+with its own clone, like separate replicas) and drives concurrent /get-cidr,
+/get-occupied-list and delete traffic for a fixed time. Reports throughput,
+p50/p95/p99 latency and error rates per operation, checks that no two
+allocations overlap, and writes the results as JSON.
+
+No GitHub access is needed - the servers use the remote_url setting. Server
+settings can be varied with --env to compare e.g. group commit windows,
+background sync or the journal format:
+
+    python benchmarks/load_test.py --duration 30 --concurrency 16
+    python benchmarks/load_test.py --servers 2 --env commit_window_ms=20 --env occupied_format=journal
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timezone
+from ipaddress import IPv4Network
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+OPERATIONS = ["get-cidr", "get-occupied-list", "delete"]
+OCCUPIED_FILE = "occupied-range.json"
+REASON_PREFIX = "load"
+
+def _git(*args: str, cwd: Optional[Path] = None) -> None:
+    subprocess.run(
+        ["git", "-c", "user.name=Load Test", "-c", "user.email=load@test.local", *args],
+        cwd=cwd, check=True, capture_output=True
+    )
+
+def create_remote(work_dir: Path, seed_entries: int) -> Path:
+    """Create the bare occupied repository with seed_entries /28s already taken in 172.16.0.0/12."""
+    remote = work_dir / "remote.git"
+    seed = work_dir / "seed"
+    _git("init", "--bare", "--initial-branch=master", str(remote))
+    _git("clone", str(remote), str(seed))
+
+    # Seeded outside the 10.0.0.0/8 range the load allocates from
+    base = int(IPv4Network("172.16.0.0/12").network_address)
+    occupied = {f"seed-{i}-1700000000": f"{IPv4Network((base + i * 16, 28))}" for i in range(seed_entries)}
+    (seed / OCCUPIED_FILE).write_text(json.dumps(occupied, indent=4))
+    _git("add", OCCUPIED_FILE, cwd=seed)
+    _git("commit", "-m", f"Seed {seed_entries} occupied CIDRs", cwd=seed)
+    _git("push", "origin", "HEAD:master", cwd=seed)
+    return remote
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_servers(work_dir: Path, remote: Path, count: int, overrides: Dict[str, str]) -> List[Tuple[subprocess.Popen, str]]:
+    """Start count servers on free ports, each with its own clone of the remote."""
+    servers = []
+    for i in range(count):
+        port = _free_port()
+        env = dict(os.environ)
+        env.update({
+            "remote_url": str(remote),
+            "git_dest_dir": str(work_dir / f"replica-{i}"),
+            "occupied_file": OCCUPIED_FILE,
+            "host": "127.0.0.1",
+            "port": str(port),
+            "log_level": "WARNING",
+            "debug": "false"
+        })
+        env.update(overrides)
+        log = open(work_dir / f"server-{i}.log", "w")
+        process = subprocess.Popen(
+            [sys.executable, str(REPO_DIR / "server" / "main.py")],
+            cwd=REPO_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+        # The server keeps its own copy of the file descriptor
+        log.close()
+        servers.append((process, f"http://127.0.0.1:{port}"))
+    return servers
+
+def wait_until_healthy(base_urls: List[str], timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    for base_url in base_urls:
+        while True:
+            try:
+                with urllib.request.urlopen(f"{base_url}/health", timeout=1):
+                    break
+            except (urllib.error.URLError, ConnectionError):
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Server at {base_url} did not become healthy within {timeout}s")
+                time.sleep(0.1)
+
+def request(method: str, url: str, timeout: float) -> Tuple[int, str]:
+    """Make a request and return its status code and body (status 0 for connection errors)."""
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method=method), timeout=timeout) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode(errors="replace")
+    except (urllib.error.URLError, ConnectionError, TimeoutError) as e:
+        return 0, str(e)
+
+class LoadGenerator:
+    """Worker threads issuing a weighted mix of operations until the deadline."""
+
+    def __init__(self, base_urls: List[str], weights: Dict[str, float], subnet_size: int, timeout: float):
+        self.base_urls = base_urls
+        self.operations = list(weights)
+        self.weights = [weights[operation] for operation in self.operations]
+        self.subnet_size = subnet_size
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._reason_counter = 0
+        # CIDRs allocated by the load and not deleted yet
+        self._allocated: List[str] = []
+        # Operation name to (latency seconds, ok) of every request
+        self.samples: Dict[str, List[Tuple[float, bool]]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def _next_reason(self) -> str:
+        with self._lock:
+            self._reason_counter += 1
+            return f"{REASON_PREFIX}-{self._reason_counter}"
+
+    def _run_once(self, rng: random.Random, base_url: str) -> None:
+        operation = rng.choices(self.operations, self.weights)[0]
+        cidr = None
+        if operation == "delete":
+            with self._lock:
+                if self._allocated:
+                    cidr = self._allocated.pop(rng.randrange(len(self._allocated)))
+            if cidr is None:
+                # Nothing to delete yet - allocate instead
+                operation = "get-cidr"
+
+        if operation == "get-cidr":
+            query = urlencode({"subnet_size": self.subnet_size, "requiredrange": "10", "reason": self._next_reason()})
+            method, url = "GET", f"{base_url}/get-cidr?{query}"
+        elif operation == "get-occupied-list":
+            method, url = "GET", f"{base_url}/get-occupied-list"
+        else:
+            method, url = "DELETE", f"{base_url}/delete-cidr-from-list?{urlencode({'cidr_deletion': cidr})}"
+
+        start = time.perf_counter()
+        status, body = request(method, url, self.timeout)
+        latency = time.perf_counter() - start
+
+        ok = status == 200
+        if ok and operation == "delete":
+            ok = "deleted successfully" in body
+        with self._lock:
+            self.samples[operation].append((latency, ok))
+            if not ok:
+                self.errors[operation][f"{status}: {body[:120]}"] += 1
+            elif operation == "get-cidr":
+                self._allocated.append(body.strip())
+
+    def run(self, concurrency: int, duration: float) -> float:
+        """Run the workers for duration seconds and return the elapsed wall time."""
+        deadline = time.monotonic() + duration
+
+        def worker(index: int) -> None:
+            rng = random.Random(index)
+            base_url = self.base_urls[index % len(self.base_urls)]
+            while time.monotonic() < deadline:
+                self._run_once(rng, base_url)
+
+        start = time.monotonic()
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.monotonic() - start
+
+def summarize(samples: List[Tuple[float, bool]], elapsed: float) -> Dict[str, Any]:
+    """Throughput, latency percentiles (ms) and error rate of one operation's requests."""
+    if not samples:
+        return {"requests": 0}
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, ok in samples if not ok)
+
+    def at(fraction: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 3)
+
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4),
+        "throughput_rps": round((len(samples) - errors) / elapsed, 2),
+        "p50_ms": at(0.50),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "max_ms": round(latencies[-1] * 1000, 3)
+    }
+
+def check_allocations(base_url: str, timeout: float) -> Dict[str, Any]:
+    """Check that no two CIDRs allocated by the load overlap in the final occupied list."""
+    status, body = request("GET", f"{base_url}/get-occupied-list", timeout)
+    if status != 200:
+        return {"checked": False, "error": f"{status}: {body[:120]}"}
+
+    networks = sorted(
+        (IPv4Network(cidr) for key, cidr in json.loads(body).items() if key.startswith(f"{REASON_PREFIX}-")),
+        key=lambda network: int(network.network_address)
+    )
+    overlaps = [
+        f"{previous} / {network}" for previous, network in zip(networks, networks[1:])
+        if int(network.network_address) <= int(previous.broadcast_address)
+    ]
+    return {"checked": True, "allocations": len(networks), "overlaps": overlaps}
+
+def _parse_pairs(values: List[str], what: str) -> Dict[str, str]:
+    pairs = {}
+    for value in values:
+        name, separator, setting = value.partition("=")
+        if not separator:
+            raise SystemExit(f"Invalid {what} '{value}', expected NAME=VALUE")
+        pairs[name.strip()] = setting.strip()
+    return pairs
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the API against a local bare git remote.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent client threads")
+    parser.add_argument("--servers", type=int, default=1, help="Server processes sharing the remote")
+    parser.add_argument("--mix", default="get-cidr=3,get-occupied-list=6,delete=1",
+                        help="Operation weights, e.g. get-cidr=3,get-occupied-list=6,delete=1")
+    parser.add_argument("--subnet-size", type=int, default=28, help="Prefix length allocated by /get-cidr")
+    parser.add_argument("--seed-entries", type=int, default=1000, help="Occupied entries in the remote to start with")
+    parser.add_argument("--env", action="append", default=[], help="Server setting as NAME=VALUE, repeatable")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--output", help="JSON results file (default: benchmarks/results/load-<timestamp>.json)")
+    parser.add_argument("--keep", action="store_true", help="Keep the remote, clones and server logs")
+    args = parser.parse_args()
+
+    weights = {name: float(weight) for name, weight in _parse_pairs(args.mix.split(","), "mix entry").items()}
+    unknown = set(weights) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit(f"Unknown operations in --mix: {sorted(unknown)}. Available: {OPERATIONS}")
+    overrides = _parse_pairs(args.env, "--env")
+
+    work_dir = Path(tempfile.mkdtemp(prefix="cidr-load-"))
+    started = datetime.now(timezone.utc)
+    servers = []
+    try:
+        remote = create_remote(work_dir, args.seed_entries)
+        servers = start_servers(work_dir, remote, args.servers, overrides)
+        base_urls = [base_url for _, base_url in servers]
+        wait_until_healthy(base_urls)
+
+        print(f"Running {args.duration:g}s of load with {args.concurrency} clients against {args.servers} server(s)")
+        generator = LoadGenerator(base_urls, weights, args.subnet_size, args.timeout)
+        elapsed = generator.run(args.concurrency, args.duration)
+
+        all_samples = [sample for samples in generator.samples.values() for sample in samples]
+        report = {
+            "started": started.isoformat(),
+            "duration_s": round(elapsed, 3),
+            "concurrency": args.concurrency,
+            "servers": args.servers,
+            "mix": weights,
+            "subnet_size": args.subnet_size,
+            "seed_entries": args.seed_entries,
+            "settings": overrides,
+            "operations": {operation: summarize(generator.samples[operation], elapsed) for operation in OPERATIONS},
+            "total": summarize(all_samples, elapsed),
+            "errors": {operation: dict(errors) for operation, errors in generator.errors.items()},
+            "consistency": check_allocations(base_urls[0], args.timeout)
+        }
+    finally:
+        for process, _ in servers:
+            process.terminate()
+        for process, _ in servers:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if args.keep:
+            print(f"Kept remote, clones and server logs in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{'operation':<18} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for operation, summary in list(report["operations"].items()) + [("total", report["total"])]:
+        if summary["requests"]:
+            print(f"{operation:<18} {summary['requests']:>9} {summary['errors']:>7} {summary['throughput_rps']:>8.1f} "
+                  f"{summary['p50_ms']:>9.1f} {summary['p95_ms']:>9.1f} {summary['p99_ms']:>9.1f}")
+    consistency = report["consistency"]
+    if consistency["checked"]:
+        print(f"{consistency['allocations']} allocations left, {len(consistency['overlaps'])} overlapping")
+    else:
+        print(f"Consistency check failed: {consistency['error']}")
+
+    output = Path(args.output) if args.output else (
+        REPO_DIR / "benchmarks" / "results" / f"load-{started.strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=4))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
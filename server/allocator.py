@@ -0,0 +1,402 @@
+"""
+Free-space allocation over integer address intervals.
+
+Occupied CIDRs are kept as a sorted index of merged integer intervals, so
+finding the first aligned free block of a prefix length only visits the
+occupied intervals that actually sit in the way instead of every candidate
+subnet of the range. BuddyAllocator keeps per-prefix free lists on top of
+that for constant-time allocation regardless of how full a range is, and
+for best-fit and size-segregated (zoned) placement.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right, insort
+from heapq import heappop, heappush
+from ipaddress import IPv4Network
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def aligned_blocks(start: int, end: int) -> Iterator[Tuple[int, int]]:
+    """Split an address interval into maximal aligned (start, prefix) blocks."""
+    while start <= end:
+        # Largest block that is aligned at start and still fits the interval
+        size = start & -start if start else 1 << 32
+        while size > end - start + 1:
+            size >>= 1
+        yield start, 33 - size.bit_length()
+        start += size
+
+
+# Size classes of the zoned strategy: requests up to each prefix length are
+# placed in the given quarters of the range - large networks in the first
+# half, medium ones in the third quarter, small ones in the last quarter
+SIZE_CLASS_ZONES = ((20, 0, 2), (24, 2, 3), (32, 3, 4))
+
+
+def size_class_zone(main_range: IPv4Network, prefix: int) -> Optional[IPv4Network]:
+    """
+    Get the zone of a range that requests of a prefix length are placed in.
+
+    Returns None if the range is too small to be split into zones, or the
+    request does not fit in its zone.
+    """
+    if main_range.prefixlen + 2 > main_range.max_prefixlen:
+        return None
+
+    quarter_prefix = main_range.prefixlen + 2
+    quarter_size = 1 << (main_range.max_prefixlen - quarter_prefix)
+    for max_prefix, first, last in SIZE_CLASS_ZONES:
+        if prefix <= max_prefix:
+            # Zones span one or two quarters, so they are aligned blocks themselves
+            zone_prefix = quarter_prefix - (last - first).bit_length() + 1
+            zone = IPv4Network((int(main_range.network_address) + first * quarter_size, zone_prefix))
+            return zone if zone.prefixlen <= prefix else None
+    return None
+
+
+def fragmentation(gaps: List[Tuple[int, int]]) -> Tuple[int, int, float]:
+    """
+    Measure how fragmented the free space of a range is.
+
+    Args:
+        gaps: Free (start, end) intervals of the range
+
+    Returns:
+        Tuple[int, int, float]: Free addresses, addresses in the largest free
+            aligned block, and the fragmentation score 1 - largest / free -
+            0 when all free space is one block, approaching 1 as it is
+            shattered into small blocks (0 for a full range)
+    """
+    free = 0
+    largest = 0
+    for start, end in gaps:
+        free += end - start + 1
+        for _, prefix in aligned_blocks(start, end):
+            largest = max(largest, 1 << (32 - prefix))
+    score = 1 - largest / free if free else 0.0
+    return free, largest, score
+
+
+def overlapping_pairs(candidates: List[Tuple[int, int]], intervals: List[Tuple[int, int]]) -> List[List[int]]:
+    """
+    Find, for every candidate interval, the positions of the intervals it overlaps.
+
+    Both lists are swept together in start order, keeping the intervals of
+    each list that are still open. Two intervals overlap exactly when one of
+    them starts inside the other, so each pair is found when the later of the
+    two starts, without comparing every candidate against every interval.
+
+    Args:
+        candidates: (start, end) intervals to check
+        intervals: (start, end) intervals to check them against
+
+    Returns:
+        List[List[int]]: Positions in intervals overlapping each candidate, in candidate order
+    """
+    events = sorted(
+        [(start, 0, end, i) for i, (start, end) in enumerate(intervals)] +
+        [(start, 1, end, i) for i, (start, end) in enumerate(candidates)]
+    )
+    matches: List[List[int]] = [[] for _ in candidates]
+    open_heaps: Tuple[List[Tuple[int, int]], List[Tuple[int, int]]] = ([], [])
+
+    for start, kind, end, i in events:
+        # Drop whatever the other list has open that ended before this start
+        other = open_heaps[1 - kind]
+        while other and other[0][0] < start:
+            heappop(other)
+
+        for _, j in other:
+            if kind == 1:
+                matches[i].append(j)
+            else:
+                matches[j].append(i)
+        heappush(open_heaps[kind], (end, i))
+
+    for positions in matches:
+        positions.sort()
+    return matches
+
+
+class IntervalIndex:
+    """Sorted index of merged, non-overlapping occupied address intervals."""
+
+    def __init__(self, intervals: Iterable[Tuple[int, int]] = ()):
+        """
+        Args:
+            intervals: Occupied (start, end) address intervals, in any order
+        """
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+
+        # Whether any two intervals were ever added overlapping, rather than
+        # just adjacent - only then can a removed interval still be partly covered
+        self.overlapping = False
+
+        for start, end in sorted(intervals):
+            if self._ends and start <= self._ends[-1] + 1:
+                # Overlapping or adjacent - extend the previous interval
+                if start <= self._ends[-1]:
+                    self.overlapping = True
+                if end > self._ends[-1]:
+                    self._ends[-1] = end
+            else:
+                self._starts.append(start)
+                self._ends.append(end)
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def bounds(self) -> Tuple[List[int], List[int]]:
+        """Starts and ends of the merged intervals, in address order."""
+        return self._starts, self._ends
+
+    def copy(self) -> "IntervalIndex":
+        """Independent copy that can be added to and removed from."""
+        other = IntervalIndex()
+        other._starts = self._starts[:]
+        other._ends = self._ends[:]
+        other.overlapping = self.overlapping
+        return other
+
+    def add(self, network: IPv4Network) -> None:
+        """Insert a network, merging it with the intervals it touches."""
+        start = int(network.network_address)
+        end = int(network.broadcast_address)
+        if self.overlaps(network):
+            self.overlapping = True
+
+        # Intervals from i up to j overlap or are adjacent to the new one
+        i = bisect_left(self._ends, start - 1)
+        j = i
+        while j < len(self._starts) and self._starts[j] <= end + 1:
+            j += 1
+        if i < j:
+            start = min(start, self._starts[i])
+            end = max(end, self._ends[j - 1])
+
+        self._starts[i:j] = [start]
+        self._ends[i:j] = [end]
+
+    def remove(self, network: IPv4Network) -> None:
+        """
+        Cut a network out of the occupied intervals.
+
+        Only valid while no intervals overlap (see overlapping) - otherwise
+        other entries may still cover part of the network, and the index has
+        to be rebuilt from them instead.
+        """
+        start = int(network.network_address)
+        end = int(network.broadcast_address)
+
+        i = bisect_right(self._starts, start) - 1
+        if i < 0 or self._ends[i] < end:
+            raise ValueError(f"{network} is not occupied")
+
+        pieces = []
+        if self._starts[i] < start:
+            pieces.append((self._starts[i], start - 1))
+        if end < self._ends[i]:
+            pieces.append((end + 1, self._ends[i]))
+        self._starts[i:i + 1] = [piece[0] for piece in pieces]
+        self._ends[i:i + 1] = [piece[1] for piece in pieces]
+
+    def overlaps(self, network: IPv4Network) -> bool:
+        """Check if a network overlaps any occupied interval."""
+        i = bisect_left(self._ends, int(network.network_address))
+        return i < len(self._starts) and self._starts[i] <= int(network.broadcast_address)
+
+    def free_ranges(self, network: IPv4Network) -> List[Tuple[int, int]]:
+        """Return the unoccupied (start, end) intervals inside a network."""
+        network_end = int(network.broadcast_address)
+        cursor = int(network.network_address)
+        gaps = []
+
+        i = bisect_left(self._ends, cursor)
+        while cursor <= network_end:
+            if i == len(self._starts) or self._starts[i] > network_end:
+                gaps.append((cursor, network_end))
+                break
+            if self._starts[i] > cursor:
+                gaps.append((cursor, self._starts[i] - 1))
+            cursor = self._ends[i] + 1
+            i += 1
+
+        return gaps
+
+    def first_fit(self, main_range: IPv4Network, prefix: int) -> Optional[IPv4Network]:
+        """
+        Find the lowest aligned free block of the given prefix in a range.
+
+        Returns the same subnet as walking main_range.subnets(new_prefix=prefix)
+        and taking the first one that overlaps no occupied interval.
+
+        Args:
+            main_range: The range to allocate from
+            prefix: The prefix length of the requested block
+
+        Returns:
+            Optional[IPv4Network]: The free block, or None if the range is full
+
+        Raises:
+            ValueError: If the prefix cannot be carved out of the range
+        """
+        if not main_range.prefixlen <= prefix <= main_range.max_prefixlen:
+            raise ValueError(f"Invalid subnet size /{prefix} for range {main_range}")
+
+        size = 1 << (main_range.max_prefixlen - prefix)
+        range_end = int(main_range.broadcast_address)
+        candidate = int(main_range.network_address)
+
+        # First occupied interval that ends at or after the candidate
+        i = bisect_left(self._ends, candidate)
+        while candidate + size - 1 <= range_end:
+            if i == len(self._starts) or self._starts[i] > candidate + size - 1:
+                return IPv4Network((candidate, prefix))
+
+            # The interval overlaps the candidate - jump to the next aligned
+            # block after it and skip intervals that end before that block
+            candidate = (self._ends[i] + size) // size * size
+            i = bisect_left(self._ends, candidate, i + 1)
+
+        return None
+
+
+class BuddyAllocator:
+    """
+    Buddy-system free lists for a single address range.
+
+    Free space is held as maximal aligned blocks, one min-heap of block starts
+    per prefix length. Allocation takes the lowest block that can hold the
+    request and splits it; releasing a block merges it with its free buddy.
+    """
+
+    def __init__(self, main_range: IPv4Network, occupied: IntervalIndex):
+        self.main_range = main_range
+        self._blocks: Dict[int, int] = {}  # free block start -> prefix
+        self._starts: List[int] = []  # sorted free block starts
+        self._free_lists: Dict[int, List[int]] = {
+            prefix: [] for prefix in range(main_range.prefixlen, main_range.max_prefixlen + 1)
+        }
+
+        # peek and best_fit drop stale heap entries, which must not race
+        # between threads reading the same allocator
+        self._lock = threading.Lock()
+
+        for start, end in occupied.free_ranges(main_range):
+            for block_start, prefix in aligned_blocks(start, end):
+                self._add(block_start, prefix)
+
+    def copy(self) -> "BuddyAllocator":
+        """Independent copy that can be reserved from and released to."""
+        other = BuddyAllocator.__new__(BuddyAllocator)
+        other.main_range = self.main_range
+        other._lock = threading.Lock()
+        with self._lock:
+            other._blocks = dict(self._blocks)
+            other._starts = self._starts[:]
+            other._free_lists = {prefix: heap[:] for prefix, heap in self._free_lists.items()}
+        return other
+
+    def _add(self, start: int, prefix: int) -> None:
+        self._blocks[start] = prefix
+        insort(self._starts, start)
+        heappush(self._free_lists[prefix], start)
+
+    def _remove(self, start: int) -> int:
+        # Heap entries are dropped lazily once they no longer match _blocks
+        prefix = self._blocks.pop(start)
+        del self._starts[bisect_left(self._starts, start)]
+        return prefix
+
+    def peek(self, prefix: int) -> Optional[IPv4Network]:
+        """
+        Find the lowest aligned free block of a prefix, without reserving it.
+
+        The lowest aligned free block of a prefix always starts at the lowest
+        free block of that prefix or larger, so this gives the same answer as
+        IntervalIndex.first_fit.
+
+        Raises:
+            ValueError: If the prefix cannot be carved out of the range
+        """
+        if not self.main_range.prefixlen <= prefix <= self.main_range.max_prefixlen:
+            raise ValueError(f"Invalid subnet size /{prefix} for range {self.main_range}")
+
+        best = None
+        with self._lock:
+            for block_prefix in range(self.main_range.prefixlen, prefix + 1):
+                heap = self._free_lists[block_prefix]
+                while heap and self._blocks.get(heap[0]) != block_prefix:
+                    heappop(heap)
+                if heap and (best is None or heap[0] < best):
+                    best = heap[0]
+
+        return IPv4Network((best, prefix)) if best is not None else None
+
+    def best_fit(self, prefix: int) -> Optional[IPv4Network]:
+        """
+        Find the lowest block of the smallest free block size that can hold a prefix.
+
+        Splitting the tightest free block leaves larger blocks intact for
+        later large requests, unlike first fit which takes whatever comes first.
+
+        Raises:
+            ValueError: If the prefix cannot be carved out of the range
+        """
+        if not self.main_range.prefixlen <= prefix <= self.main_range.max_prefixlen:
+            raise ValueError(f"Invalid subnet size /{prefix} for range {self.main_range}")
+
+        with self._lock:
+            for block_prefix in range(prefix, self.main_range.prefixlen - 1, -1):
+                heap = self._free_lists[block_prefix]
+                while heap and self._blocks.get(heap[0]) != block_prefix:
+                    heappop(heap)
+                if heap:
+                    return IPv4Network((heap[0], prefix))
+        return None
+
+    def reserve(self, network: IPv4Network) -> None:
+        """Mark a network as occupied, splitting the free blocks it touches."""
+        start = int(network.network_address)
+        end = int(network.broadcast_address)
+        max_prefixlen = self.main_range.max_prefixlen
+
+        # At most one free block contains the network's first address...
+        affected = set()
+        for prefix in range(self.main_range.prefixlen, min(network.prefixlen, max_prefixlen) + 1):
+            block_start = start >> (max_prefixlen - prefix) << (max_prefixlen - prefix)
+            if self._blocks.get(block_start) == prefix:
+                affected.add(block_start)
+                break
+
+        # ...and any number of smaller free blocks can sit inside it
+        affected.update(self._starts[bisect_left(self._starts, start):bisect_right(self._starts, end)])
+
+        for block_start in affected:
+            block_end = block_start + (1 << (max_prefixlen - self._remove(block_start))) - 1
+            if block_start < start:
+                for piece_start, piece_prefix in aligned_blocks(block_start, start - 1):
+                    self._add(piece_start, piece_prefix)
+            if block_end > end:
+                for piece_start, piece_prefix in aligned_blocks(end + 1, block_end):
+                    self._add(piece_start, piece_prefix)
+
+    def release(self, network: IPv4Network) -> None:
+        """Return a free network to the lists, merging it with free buddies."""
+        if not network.overlaps(self.main_range):
+            return
+        if self.main_range.subnet_of(network):
+            network = self.main_range
+
+        max_prefixlen = self.main_range.max_prefixlen
+        for start, prefix in aligned_blocks(int(network.network_address), int(network.broadcast_address)):
+            while prefix > self.main_range.prefixlen:
+                size = 1 << (max_prefixlen - prefix)
+                buddy = start ^ size
+                if self._blocks.get(buddy) != prefix:
+                    break
+                self._remove(buddy)
+                start &= ~size
+                prefix -= 1
+            self._add(start, prefix)
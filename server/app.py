@@ -2,17 +2,28 @@
 CIDR Manager Application
 """
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import json
+import time
+from contextlib import asynccontextmanager
+from itertools import islice
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterator, List, Optional
 
 from services import CIDRService, SubnetService
+from models import (
+    BatchCIDRRequest, BatchCIDRResponse, CIDRStatistics, ConflictCheckResponse, FragmentationResponse, FreeBlocksResponse,
+    RangeInfo
+)
+from sync import RepositorySyncer
+from executor import ServiceExecutor
 from config import get_settings
+import metrics
+from profiling import SamplingProfiler
 
 # Configure logging
 logging.basicConfig(
@@ -21,6 +32,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the background repository sync for the lifetime of the app."""
+    settings = get_settings()
+    syncer = None
+    if settings.sync_interval_seconds > 0 and settings.storage_backend == "git":
+        syncer = RepositorySyncer(cidr_service.storage.git_manager, settings.sync_interval_seconds)
+        syncer.start()
+    try:
+        yield
+    finally:
+        if syncer is not None:
+            syncer.stop()
+        service_executor.shutdown()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="CIDR Manager API",
@@ -28,7 +54,8 @@ app = FastAPI(
     version="3.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_url="/openapi.json"
+    openapi_url="/openapi.json",
+    lifespan=lifespan
 )
 
 # Add CORS middleware with configurable origins
@@ -36,10 +63,77 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
-    allow_methods=["GET", "DELETE"],  # Allow GET and DELETE methods
+    allow_methods=["GET", "POST", "DELETE"],  # Allow GET, POST and DELETE methods
     allow_headers=["*"],
 )
 
+# Server-Timing metric each service phase is reported under
+SERVER_TIMING_PHASES = {
+    "sync": "git",
+    "push": "git",
+    "load": "parse",
+    "search": "search",
+    "save": "serialize",
+    "serialize": "serialize"
+}
+
+# Endpoints that change the occupied list. Profiling replaces the response,
+# so the CIDR a request allocated or the outcome of a change would be lost.
+MUTATING_PATHS = {"/get-cidr", "/get-cidr-batch", "/delete-cidr-from-list", "/add-cidr-manually"}
+
+def _format_server_timing(timings: Dict[str, float], total: float) -> str:
+    """Server-Timing header value with the phase totals in milliseconds."""
+    durations: Dict[str, float] = {}
+    for phase, seconds in timings.items():
+        name = SERVER_TIMING_PHASES.get(phase, phase)
+        durations[name] = durations.get(name, 0.0) + seconds
+    durations["total"] = total
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in durations.items())
+
+@app.middleware("http")
+async def request_diagnostics(request: Request, call_next):
+    """
+    Add the optional Server-Timing header, and profile requests made with
+    ?profile=1 in debug mode - those return the top sampled frames instead
+    of their usual response. Only read-only endpoints can be profiled.
+    """
+    settings = get_settings()
+    profiler = None
+    if settings.debug and request.query_params.get("profile") in ("1", "true"):
+        if request.url.path in MUTATING_PATHS:
+            return JSONResponse(
+                {"detail": "profile=1 is only supported on read-only endpoints"},
+                status_code=400
+            )
+        profiler = SamplingProfiler()
+        profiler.start()
+    
+    start = time.perf_counter()
+    with metrics.request_timing() as timings:
+        try:
+            response = await call_next(request)
+        finally:
+            if profiler is not None:
+                profiler.stop()
+    total = time.perf_counter() - start
+    
+    if profiler is not None:
+        # Drain the real response so the endpoint finishes cleanly
+        async for _ in response.body_iterator:
+            pass
+        return JSONResponse({
+            "path": request.url.path,
+            "status_code": response.status_code,
+            "duration_ms": round(total * 1000, 3),
+            "timings_ms": {phase: round(seconds * 1000, 3) for phase, seconds in timings.items()},
+            "samples": profiler.samples,
+            "top": profiler.top()
+        })
+    
+    if settings.server_timing:
+        response.headers["Server-Timing"] = _format_server_timing(timings, total)
+    return response
+
 # Mount static files
 frontend_path = Path(__file__).parent.parent / "frontend"
 content_path = Path(__file__).parent.parent / "content"
@@ -50,6 +144,9 @@ app.mount("/static", StaticFiles(directory=str(frontend_path)), name="static")
 cidr_service = CIDRService()
 subnet_service = SubnetService()
 
+# Blocking service calls run here instead of on the event loop
+service_executor = ServiceExecutor(max_workers=get_settings().service_threads)
+
 @app.get("/", response_class=HTMLResponse, include_in_schema=False)
 async def serve_frontend():
     """Serve the main frontend HTML page."""
@@ -111,6 +208,19 @@ async def health_check():
     """Health check endpoint for monitoring."""
     return {"status": "healthy", "service": "cidr-manager", "version": "3.0.0"}
 
+@app.get("/queue-stats")
+async def queue_stats():
+    """Queue depth and wait times of the service thread pool and the mutation queue."""
+    return {
+        "executor": service_executor.stats(),
+        "mutations": cidr_service.commit_coalescer.stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Per-phase latency histograms, allocation counters and gauges in the Prometheus text format."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 # API endpoints
 @app.get("/get-cidr", response_class=PlainTextResponse)
 async def get_cidr(
@@ -125,7 +235,8 @@ async def get_cidr(
     """
     try:
         logger.info(f"Getting unique CIDR for reason: {reason}")
-        result = cidr_service.get_unique_cidr(
+        result = await service_executor.run(
+            cidr_service.get_unique_cidr,
             subnet_size=int(subnet_size),
             required_range=requiredrange,
             reason=reason
@@ -138,6 +249,61 @@ async def get_cidr(
         logger.error(f"Error getting unique CIDR: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/get-cidr-batch", response_model=BatchCIDRResponse)
+async def get_cidr_batch(request: BatchCIDRRequest):
+    """
+    Allocate several unique CIDR blocks and record them in a single commit.
+    
+    Each item is handled like a /get-cidr call against the same snapshot, so
+    reasons already used (including earlier in the batch) return their existing
+    CIDR. Items that cannot be allocated report an error without failing the batch.
+    """
+    try:
+        logger.info(f"Getting {len(request.items)} unique CIDRs in batch")
+        results = await service_executor.run(
+            cidr_service.get_unique_cidrs_batch,
+            [item.model_dump() for item in request.items]
+        )
+        return BatchCIDRResponse(results=results)
+    except Exception as e:
+        logger.error(f"Error getting CIDR batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _parse_cidr_list(body: bytes, content_type: str) -> List[str]:
+    """Read candidate CIDRs from a JSON list (or {"cidrs": [...]}) or from newline-separated text."""
+    if "json" in content_type:
+        try:
+            data = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON body: {e}")
+        if isinstance(data, dict):
+            data = data.get("cidrs")
+        if not isinstance(data, list) or not all(isinstance(cidr, str) for cidr in data):
+            raise ValueError("JSON body must be a list of CIDR strings or an object with a 'cidrs' list")
+        return [cidr.strip() for cidr in data]
+    
+    return [line.strip() for line in body.decode().splitlines() if line.strip()]
+
+@app.post("/check-conflicts", response_model=ConflictCheckResponse)
+async def check_conflicts(request: Request):
+    """
+    Check many candidate CIDRs against the occupied list in one call.
+    
+    The body is either a JSON list of CIDRs or plain text with one CIDR per
+    line. Nothing is allocated or pushed.
+    """
+    try:
+        cidrs = _parse_cidr_list(await request.body(), request.headers.get("content-type", ""))
+        logger.info(f"Checking {len(cidrs)} CIDRs for conflicts")
+        result = await service_executor.run(cidr_service.check_conflicts, cidrs)
+        return ConflictCheckResponse(**result)
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error checking conflicts: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/get-next-cidr-no-push", response_class=PlainTextResponse)
 async def get_next_cidr_no_push(
     subnet_size: str = Query(..., description="Subnet size (e.g., 24 for /24)"),
@@ -151,7 +317,8 @@ async def get_next_cidr_no_push(
     """
     try:
         logger.info(f"Previewing next CIDR for reason: {reason}")
-        result = cidr_service.get_next_cidr_no_push(
+        result = await service_executor.run(
+            cidr_service.get_next_cidr_no_push,
             subnet_size=int(subnet_size),
             required_range=requiredrange,
             reason=reason
@@ -164,6 +331,111 @@ async def get_next_cidr_no_push(
         logger.error(f"Error previewing CIDR: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/get-free-subnets", response_class=PlainTextResponse)
+async def get_free_subnets(
+    subnet_size: str = Query(..., description="Subnet size (e.g., 24 for /24)"),
+    requiredrange: str = Query(..., description="Required range (10, 172, or 192)"),
+    limit: Optional[int] = Query(None, description="Maximum number of subnets to return")
+):
+    """
+    List all free subnets of a given size in a range, space-separated.
+    
+    Nothing is allocated - this is meant for capacity planning.
+    """
+    try:
+        logger.info(f"Getting free /{subnet_size} subnets in range {requiredrange}")
+        result = await service_executor.run(
+            cidr_service.get_free_subnets,
+            subnet_size=int(subnet_size),
+            required_range=requiredrange,
+            limit=limit
+        )
+        with metrics.request_phase("serialize"):
+            return " ".join(result)
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting free subnets: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/get-largest-free-blocks", response_model=FreeBlocksResponse)
+async def get_largest_free_blocks(
+    count: int = Query(10, description="Number of largest free blocks to return per range"),
+    free_limit: Optional[int] = Query(None, description="Maximum number of maximal free CIDRs to list per range")
+):
+    """
+    Get the largest free aligned blocks and the maximal free CIDRs of every range.
+    
+    Nothing is allocated - this answers what still fits in one call.
+    """
+    try:
+        logger.info(f"Getting the {count} largest free blocks per range")
+        result = await service_executor.run(
+            cidr_service.get_largest_free_blocks,
+            count=count,
+            free_limit=free_limit
+        )
+        return FreeBlocksResponse(ranges=result)
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting largest free blocks: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/get-fragmentation", response_model=FragmentationResponse)
+async def get_fragmentation():
+    """
+    Report how fragmented the free space of every range is.
+    
+    The score is 1 - largest free aligned block / free addresses: 0 when the
+    free space is a single block, close to 1 when only small blocks are left.
+    """
+    try:
+        logger.info("Measuring range fragmentation")
+        result = await service_executor.run(cidr_service.get_fragmentation)
+        return FragmentationResponse(strategy=get_settings().allocation_strategy, ranges=result)
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error measuring fragmentation: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/get-statistics", response_model=CIDRStatistics)
+async def get_statistics():
+    """
+    Get allocation counts by range and subnet size, used versus free addresses
+    per range, and the most recent allocation.
+    """
+    try:
+        logger.info("Getting occupied list statistics")
+        return await service_executor.run(cidr_service.get_statistics)
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting statistics: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/get-ranges", response_model=List[RangeInfo])
+async def get_ranges():
+    """
+    Get every range in addresses-range.json with its allocation count and
+    used versus free addresses.
+    """
+    try:
+        logger.info("Getting range usage")
+        statistics = await service_executor.run(cidr_service.get_statistics)
+        return statistics["ranges"]
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error getting range usage: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/get-occupied-list", response_class=PlainTextResponse)
 async def get_occupied_list():
     """
@@ -173,8 +445,9 @@ async def get_occupied_list():
     """
     try:
         logger.info("Getting occupied CIDR list")
-        result = cidr_service.get_all_occupied()
-        return json.dumps(result, indent=4)
+        result = await service_executor.run(cidr_service.get_all_occupied)
+        with metrics.request_phase("serialize"):
+            return json.dumps(result, indent=4)
     except Exception as e:
         logger.error(f"Error getting occupied list: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -190,7 +463,7 @@ async def delete_cidr_from_list(
     """
     try:
         logger.info(f"Deleting CIDR: {cidr_deletion}")
-        result = cidr_service.delete_cidr_from_list(cidr_deletion)
+        result = await service_executor.run(cidr_service.delete_cidr_from_list, cidr_deletion)
         return result
     except Exception as e:
         logger.error(f"Error deleting CIDR: {str(e)}")
@@ -208,7 +481,7 @@ async def delete_cidr_from_list_delete(
     """
     try:
         logger.info(f"Deleting CIDR via DELETE method: {cidr_deletion}")
-        result = cidr_service.delete_cidr_from_list(cidr_deletion)
+        result = await service_executor.run(cidr_service.delete_cidr_from_list, cidr_deletion)
         return result
     except Exception as e:
         logger.error(f"Error deleting CIDR: {str(e)}")
@@ -226,7 +499,7 @@ async def add_cidr_manually(
     """
     try:
         logger.info(f"Manually adding CIDR: {cidr} for reason: {reason}")
-        result = cidr_service.manually_add_cidr(cidr, reason)
+        result = await service_executor.run(cidr_service.manually_add_cidr, cidr, reason)
         return result
     except Exception as e:
         logger.error(f"Error adding CIDR manually: {str(e)}")
@@ -235,12 +508,18 @@ async def add_cidr_manually(
 @app.get("/get-subnets", response_class=PlainTextResponse)
 async def get_subnets(
     subnet_size: str = Query(..., description="Target subnet size (e.g., 26 for /26)"),
-    cidr: str = Query(..., description="Source CIDR block (e.g., 10.0.0.0/24)")
+    cidr: str = Query(..., description="Source CIDR block (e.g., 10.0.0.0/24)"),
+    offset: int = Query(0, description="Number of leading subnets to skip"),
+    limit: Optional[int] = Query(None, description="Maximum number of subnets to return"),
+    stream: bool = Query(False, description="Stream the subnets as a chunked response"),
+    count_only: bool = Query(False, description="Only return the number of subnets")
 ):
     """
     Calculate subnets from a given CIDR block.
     
     Original endpoint - returns space-separated subnets exactly like the legacy system.
+    Large expansions can be paged with offset/limit, streamed with constant memory,
+    or just counted.
     """
     try:
         logger.info(f"Getting subnets from CIDR: {cidr} with size: {subnet_size}")
@@ -255,12 +534,24 @@ async def get_subnets(
         except ValueError:
             raise ValueError(f"Invalid subnet_size: {subnet_size}. Must be an integer.")
         
+        if count_only:
+            return str(subnet_service.count_subnets(subnet_size_int, cidr))
+        
+        if stream:
+            # Validates eagerly, so errors still surface before the response starts
+            subnets = subnet_service.iter_subnets_from_cidr(subnet_size_int, cidr, offset, limit)
+            logger.info(f"Streaming subnets of size /{subnet_size_int} from {cidr}")
+            return StreamingResponse(_join_in_chunks(subnets), media_type="text/plain")
+        
         # Call the service
-        result = subnet_service.get_subnets_from_cidr(subnet_size_int, cidr)
+        result = await service_executor.run(
+            subnet_service.get_subnets_from_cidr, subnet_size_int, cidr, offset, limit
+        )
         
         # Join results with spaces
-        response_text = " ".join(result)
-        logger.info(f"Returning {len(result)} subnets: {response_text}")
+        with metrics.request_phase("serialize"):
+            response_text = " ".join(result)
+        logger.info(f"Returning {len(result)} subnets")
         
         return response_text
         
@@ -271,6 +562,17 @@ async def get_subnets(
         logger.error(f"Error getting subnets: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _join_in_chunks(subnets: Iterator[str], chunk_size: int = 4096) -> Iterator[str]:
+    """Space-join subnets a chunk at a time for a streaming response."""
+    separator = ""
+    while True:
+        chunk = list(islice(subnets, chunk_size))
+        if not chunk:
+            return
+        yield separator + " ".join(chunk)
+        separator = " "
+
+
 if __name__ == "__main__":
     import uvicorn
     settings = get_settings()
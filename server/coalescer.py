@@ -0,0 +1,124 @@
+"""
+Group commit for occupied CIDR mutations.
+
+Mutations are queued in arrival order and drained by a single worker thread,
+which keeps them serialized on the working tree. Whatever has queued up
+while a commit is in flight (or within a short window after the first
+mutation) is applied together and recorded with a single commit and push,
+after which every waiting caller gets its own result.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class PendingMutation:
+    """A mutation waiting to be applied, and the future its caller waits on."""
+
+    __slots__ = ("apply", "future", "submitted_at", "context")
+
+    def __init__(self, apply: Callable):
+        self.apply = apply
+        self.future: Future = Future()
+        self.submitted_at = time.monotonic()
+        # The caller's context variables, for running the mutation on its behalf
+        self.context = contextvars.copy_context()
+
+class CommitCoalescer:
+    """FIFO mutation queue that gathers concurrent mutations into group commits."""
+
+    def __init__(self, process_batch: Callable[[List[PendingMutation]], None], window_seconds: float = 0):
+        """
+        Args:
+            process_batch: Applies a batch of mutations in order, commits once
+                and resolves each mutation's future
+            window_seconds: Extra time to wait for more mutations to join a
+                batch once the first one arrives
+        """
+        self.process_batch = process_batch
+        self.window_seconds = window_seconds
+        self._queue: Deque[PendingMutation] = deque()
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+        # Queue statistics
+        self._in_flight = 0
+        self._processed = 0
+        self._batches = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def submit(self, apply: Callable) -> Any:
+        """
+        Queue a mutation for the next group commit and wait for it.
+
+        Args:
+            apply: Callable run with the occupied snapshot, see CIDRService
+
+        Returns:
+            Any: Whatever the mutation returned once its commit was pushed
+
+        Raises:
+            Exception: If the mutation or its group commit failed
+        """
+        mutation = PendingMutation(apply)
+
+        with self._condition:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="commit-coalescer", daemon=True)
+                self._thread.start()
+            self._queue.append(mutation)
+            self._condition.notify()
+
+        return mutation.future.result()
+
+    def stats(self) -> Dict[str, Any]:
+        """Current queue depth and how long mutations waited to be applied."""
+        with self._condition:
+            return {
+                "queue_depth": len(self._queue),
+                "in_flight": self._in_flight,
+                "processed": self._processed,
+                "batches": self._batches,
+                "avg_wait_ms": round(self._wait_total / self._processed * 1000, 3) if self._processed else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 3),
+            }
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+
+            if self.window_seconds > 0:
+                time.sleep(self.window_seconds)
+
+            with self._condition:
+                batch = list(self._queue)
+                self._queue.clear()
+
+                now = time.monotonic()
+                for pending in batch:
+                    wait = now - pending.submitted_at
+                    self._wait_total += wait
+                    self._wait_max = max(self._wait_max, wait)
+                self._in_flight = len(batch)
+
+            logger.info(f"Group commit of {len(batch)} mutation(s)")
+            try:
+                self.process_batch(batch)
+            except Exception as e:
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+            finally:
+                with self._condition:
+                    self._in_flight = 0
+                    self._processed += len(batch)
+                    self._batches += 1
@@ -14,6 +14,9 @@ from pydantic_settings import BaseSettings
 
 logger = logging.getLogger(__name__)
 
+# Background sync interval used when several workers share the clone and none is set
+WORKER_SYNC_INTERVAL_SECONDS = 1.0
+
 class Settings(BaseSettings):
     """Application settings loaded from environment variables."""
     
@@ -21,12 +24,28 @@ class Settings(BaseSettings):
     host: str = Field(default="0.0.0.0", description="Server host")
     port: int = Field(default=8000, description="Server port")
     debug: bool = Field(default=False, description="Debug mode")
+    workers: int = Field(default=1, description="Uvicorn worker processes sharing the git clone (ignored in debug mode, which reloads)")
+    
+    # Storage configuration
+    storage_backend: str = Field(default="git", description="Where occupied CIDRs are stored: 'git' (GitHub repository) or 'sqlite' (local database)")
+    sqlite_path: str = Field(default="occupied.db", description="SQLite database file for the sqlite storage backend")
     
     # Git configuration
-    access_token: str = Field(..., description="GitHub access token")
-    occupied_repo: str = Field(..., description="GitHub repository for occupied CIDRs")
+    remote_url: str = Field(default="", description="Git remote to use instead of the GitHub repository, e.g. file:///srv/occupied.git or a local path")
+    access_token: str = Field(default="", description="GitHub access token (required for git storage without remote_url)")
+    occupied_repo: str = Field(default="", description="GitHub repository for occupied CIDRs (required for git storage without remote_url)")
     occupied_file: str = Field(default="occupied-range.json", description="Occupied CIDRs filename")
+    occupied_format: str = Field(default="json", description="How changes are written: 'json' (rewrite the file) or 'journal' (append to <occupied_file>.journal)")
+    journal_compact_entries: int = Field(default=1000, description="Journal lines after which the occupied file is rewritten and the journal emptied")
     git_dest_dir: str = Field(default="infra", description="Local git repository directory")
+    git_clone_mode: str = Field(default="full", description="Clone mode: 'full', 'shallow' (recent history), 'blobless' (contents on demand) or 'sparse' (shallow, blobless, occupied file only)")
+    git_clone_depth: int = Field(default=1, description="Commits of history fetched by shallow and sparse clones")
+    sync_interval_seconds: float = Field(default=0, description="Background fetch interval in seconds (0 pulls on every request)")
+    push_max_retries: int = Field(default=10, description="Times to re-apply and retry a push rejected because the remote moved ahead")
+    push_retry_backoff_ms: float = Field(default=100, description="Backoff before the second retry of a rejected push, doubled per attempt up to 16 times as long")
+    commit_window_ms: float = Field(default=0, description="Extra time to wait for concurrent mutations to join a group commit")
+    max_staleness_seconds: float = Field(default=0, description="Maximum snapshot age for read requests with background sync (0 for no bound)")
+    statistics_max_age_seconds: float = Field(default=5, description="How long statistics are served from the loaded occupied list before it is synced again (0 syncs on every request)")
     
     # Git committer information
     committer_name: str = Field(default="Unique CIDR Manager", description="Git committer name")
@@ -35,13 +54,20 @@ class Settings(BaseSettings):
     # Application configuration
     log_level: str = Field(default="INFO", description="Logging level")
     max_reason_length: int = Field(default=100, description="Maximum length for reason field")
+    service_threads: int = Field(default=16, description="Threads for blocking git and file work")
+    vectorized_backend: bool = Field(default=True, description="Use NumPy for bulk subnet and overlap math when it is installed")
+    server_timing: bool = Field(default=False, description="Add a Server-Timing header with git, parse, search and serialize time to API responses")
+    allocator_mode: str = Field(default="index", description="Free-space allocator: 'index' (interval scan) or 'buddy' (per-prefix free lists)")
+    allocation_strategy: str = Field(default="first-fit", description="Placement: 'first-fit' (lowest free block), 'best-fit' (tightest free block) or 'zoned' (best fit within a zone per size class)")
     
     # CORS configuration
     allowed_origins: str = Field(default="*", description="Comma-separated list of allowed origins for CORS")
     
     @property
     def https_remote_url(self) -> str:
-        """Construct the HTTPS remote URL for Git operations."""
+        """Construct the HTTPS remote URL for Git operations, unless remote_url overrides it."""
+        if self.remote_url:
+            return self.remote_url
         return f"https://{self.access_token}@github.com/{self.occupied_repo}"
     
     @property
@@ -51,17 +77,25 @@ class Settings(BaseSettings):
             return ["*"]
         return [origin.strip() for origin in self.allowed_origins.split(",") if origin.strip()]
     
-    @validator('access_token')
-    def validate_access_token(cls, v):
-        """Validate GitHub access token is provided."""
-        if not v:
+    @validator('storage_backend')
+    def validate_storage_backend(cls, v):
+        """Validate storage backend."""
+        valid_backends = ['git', 'sqlite']
+        if v.lower() not in valid_backends:
+            raise ValueError(f"Storage backend must be one of: {valid_backends}")
+        return v.lower()
+    
+    @validator('access_token', always=True)
+    def validate_access_token(cls, v, values):
+        """Validate GitHub access token is provided when storing in GitHub."""
+        if not v and values.get('storage_backend') == 'git' and not values.get('remote_url'):
             raise ValueError("GitHub access token is required")
         return v
     
-    @validator('occupied_repo')
-    def validate_occupied_repo(cls, v):
-        """Validate repository format."""
-        if not v or '/' not in v:
+    @validator('occupied_repo', always=True)
+    def validate_occupied_repo(cls, v, values):
+        """Validate repository format when storing in GitHub."""
+        if values.get('storage_backend') == 'git' and not values.get('remote_url') and (not v or '/' not in v):
             raise ValueError("Repository must be in format 'owner/repo'")
         return v
     
@@ -72,6 +106,66 @@ class Settings(BaseSettings):
             raise ValueError("Port must be between 1 and 65535")
         return v
     
+    @validator('workers')
+    def validate_workers(cls, v):
+        """Validate worker process count."""
+        if v < 1:
+            raise ValueError("Workers must be at least 1")
+        return v
+    
+    @validator('sync_interval_seconds')
+    def validate_sync_interval_for_workers(cls, v, values):
+        """Enable background sync when several workers share the clone."""
+        if v == 0 and values.get('workers', 1) > 1 and not values.get('debug') and values.get('storage_backend') == 'git':
+            # Pulling on every request would serialize all reads across the workers on the clone's lock
+            logger.warning(f"Several workers share the git clone - syncing it in the background every {WORKER_SYNC_INTERVAL_SECONDS}s")
+            return WORKER_SYNC_INTERVAL_SECONDS
+        return v
+    
+    @validator('push_max_retries')
+    def validate_push_max_retries(cls, v):
+        """Validate push retry count."""
+        if v < 0:
+            raise ValueError("Push retries cannot be negative")
+        return v
+    
+    @validator('service_threads')
+    def validate_service_threads(cls, v):
+        """Validate service thread count."""
+        if v < 1:
+            raise ValueError("Service threads must be at least 1")
+        return v
+    
+    @validator('git_clone_mode')
+    def validate_git_clone_mode(cls, v):
+        """Validate git clone mode."""
+        valid_modes = ['full', 'shallow', 'blobless', 'sparse']
+        if v.lower() not in valid_modes:
+            raise ValueError(f"Git clone mode must be one of: {valid_modes}")
+        return v.lower()
+    
+    @validator('git_clone_depth')
+    def validate_git_clone_depth(cls, v):
+        """Validate git clone depth."""
+        if v < 1:
+            raise ValueError("Git clone depth must be at least 1")
+        return v
+    
+    @validator('occupied_format')
+    def validate_occupied_format(cls, v):
+        """Validate occupied file format."""
+        valid_formats = ['json', 'journal']
+        if v.lower() not in valid_formats:
+            raise ValueError(f"Occupied format must be one of: {valid_formats}")
+        return v.lower()
+    
+    @validator('journal_compact_entries')
+    def validate_journal_compact_entries(cls, v):
+        """Validate journal compaction threshold."""
+        if v < 0:
+            raise ValueError("Journal compaction threshold cannot be negative")
+        return v
+    
     @validator('log_level')
     def validate_log_level(cls, v):
         """Validate log level."""
@@ -80,6 +174,29 @@ class Settings(BaseSettings):
             raise ValueError(f"Log level must be one of: {valid_levels}")
         return v.upper()
     
+    @validator('sync_interval_seconds', 'max_staleness_seconds', 'commit_window_ms', 'push_retry_backoff_ms', 'statistics_max_age_seconds')
+    def validate_non_negative_seconds(cls, v):
+        """Validate durations are not negative."""
+        if v < 0:
+            raise ValueError("Duration cannot be negative")
+        return v
+    
+    @validator('allocation_strategy')
+    def validate_allocation_strategy(cls, v):
+        """Validate allocation strategy."""
+        valid_strategies = ['first-fit', 'best-fit', 'zoned']
+        if v.lower() not in valid_strategies:
+            raise ValueError(f"Allocation strategy must be one of: {valid_strategies}")
+        return v.lower()
+    
+    @validator('allocator_mode')
+    def validate_allocator_mode(cls, v):
+        """Validate allocator mode."""
+        valid_modes = ['index', 'buddy']
+        if v.lower() not in valid_modes:
+            raise ValueError(f"Allocator mode must be one of: {valid_modes}")
+        return v.lower()
+    
     model_config = {
         "env_file": ".env",
         "env_file_encoding": "utf-8",
@@ -137,6 +254,8 @@ def validate_environment() -> bool:
     """
     # Use EXACT same environment variable names as original system
     required_vars = ['access_token', 'occupied_repo']
+    if os.getenv('storage_backend', 'git').lower() != 'git' or os.getenv('remote_url'):
+        required_vars = []
     missing_vars = []
     
     for var in required_vars:
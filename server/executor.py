@@ -0,0 +1,73 @@
+"""
+Bounded thread pool for the blocking service calls made by the API.
+
+CIDRService talks to git and the file system synchronously. Running those
+calls here keeps the asyncio event loop free, so a slow pull or push never
+stalls unrelated requests such as /health.
+"""
+
+import asyncio
+import contextvars
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+class ServiceExecutor:
+    """Runs blocking service calls on a bounded thread pool and tracks queueing."""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cidr-service")
+        self._lock = threading.Lock()
+
+        # Queue statistics
+        self._queued = 0
+        self._running = 0
+        self._started = 0
+        self._completed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) on the pool and await its result."""
+        submitted_at = time.monotonic()
+        with self._lock:
+            self._queued += 1
+
+        def call():
+            wait = time.monotonic() - submitted_at
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._started += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+
+        # Carry the request's context variables into the worker thread
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(context.run, call))
+
+    def stats(self) -> Dict[str, Any]:
+        """Current pool queue depth and how long calls waited for a thread."""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "avg_wait_ms": round(self._wait_total / self._started * 1000, 3) if self._started else 0.0,
+                "max_wait_ms": round(self._wait_max * 1000, 3),
+            }
+
+    def shutdown(self) -> None:
+        """Stop accepting calls and wait for running ones to finish."""
+        self._executor.shutdown(wait=True)
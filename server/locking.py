@@ -0,0 +1,83 @@
+"""
+Lock shared by the worker processes of one deployment.
+
+With several uvicorn workers, every process has its own GitManager but they
+all use the same clone in git_dest_dir. Fast-forwarding and committing move
+the same refs, so they are serialized across processes with an flock on a
+file next to the clone. Fetches only move the remote-tracking refs and take
+a lock file of their own, so they do not hold up the rest. Within a process
+a lock is reentrant and also serializes threads.
+
+fcntl is only available on Unix; elsewhere the lock falls back to
+serializing the threads of the current process, which is enough for a
+single worker.
+"""
+
+import logging
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+def available() -> bool:
+    """Check whether locks are held across processes, not just threads."""
+    return fcntl is not None
+
+class ProcessLock:
+    """Reentrant lock held across threads and processes through flock on a lock file."""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Lock file, created if it does not exist
+        """
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Args:
+            blocking: Wait for the lock. Without it, give up straight away if
+                another thread or process holds it
+
+        Returns:
+            bool: Whether the lock was acquired
+        """
+        if not self._lock.acquire(blocking):
+            return False
+        try:
+            if self._depth == 0 and fcntl is not None:
+                if self._file is None:
+                    Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+                    self._file = open(self.path, "a+b")
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock.release()
+            return False
+        except BaseException:
+            self._lock.release()
+            raise
+        self._depth += 1
+        return True
+
+    def release(self) -> None:
+        self._depth -= 1
+        try:
+            if self._depth == 0 and self._file is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._lock.release()
+
+    def __enter__(self) -> "ProcessLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
@@ -16,6 +16,7 @@ sys.path.insert(0, str(server_dir))
 try:
     import uvicorn
     from config import get_settings, validate_environment
+    import locking
     
     logger = logging.getLogger(__name__)
     
@@ -29,8 +30,11 @@ try:
             logger.error(f"Failed to load configuration: {e}")
             sys.exit(1)
         
+        if settings.workers > 1 and not settings.debug and settings.storage_backend == "git" and not locking.available():
+            logger.warning("File locks are not available on this platform - worker processes may corrupt the shared git clone, use workers=1")
+        
         # Start the server
-        logger.info("Starting CIDR Manager FastAPI server...")
+        logger.info(f"Starting CIDR Manager FastAPI server with {settings.workers} worker(s)...")
         logger.info(f"Server will be available at: http://{settings.host}:{settings.port}")
         logger.info(f"API documentation will be available at: http://{settings.host}:{settings.port}/docs")
         logger.info(f"Alternative API docs at: http://{settings.host}:{settings.port}/redoc")
@@ -40,6 +44,7 @@ try:
             host=settings.host,
             port=settings.port,
             reload=settings.debug,
+            workers=None if settings.debug else settings.workers,
             log_level=settings.log_level.lower(),
             access_log=True,
             server_header=False,  # Security: don't expose server info
@@ -0,0 +1,298 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Service methods are wrapped with instrumented(), which records their total
+latency and makes them the current method for any phase() timed inside, so
+a slow /get-cidr can be broken down into time spent syncing with the
+remote, loading the occupied state, searching for a subnet, saving the
+changes and pushing them. Everything lives in one process-wide registry
+rendered by the /metrics endpoint; no client library is needed.
+
+The same phases can also be collected per request with request_timing(),
+for the optional Server-Timing response header.
+"""
+
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+# Seconds - from in-memory lookups up to slow pushes over a congested network
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Service methods phases are attributed to. Group commits run on behalf of
+# every method with a mutation in the group, hence a tuple.
+_current_methods: contextvars.ContextVar[Tuple[str, ...]] = contextvars.ContextVar("current_methods", default=())
+
+# Per-request phase totals being collected, see request_timing()
+_request_timings: contextvars.ContextVar[Tuple[Dict[str, float], ...]] = contextvars.ContextVar(
+    "request_timings", default=()
+)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class _Metric:
+    """A named metric family with a fixed set of label names."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.labelnames:
+            values = [((), 0)]
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+class Histogram(_Metric):
+    """Distribution of observed values over cumulative buckets."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: non-cumulative bucket counts (last one is +Inf), sum and count
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        # First bucket whose upper bound holds the value
+        position = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[position] += 1
+            total[0] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Collection of metric families rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Content type of REGISTRY.render()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+METHOD_SECONDS = REGISTRY.histogram(
+    "cidr_manager_method_seconds", "Total latency of service methods.", ["method"]
+)
+PHASE_SECONDS = REGISTRY.histogram(
+    "cidr_manager_phase_seconds",
+    "Latency of each phase (sync, load, search, serialize, save, push) of service methods.",
+    ["method", "phase"]
+)
+ALLOCATIONS = REGISTRY.counter(
+    "cidr_manager_allocations_total", "CIDRs newly allocated, by range.", ["range"]
+)
+REASON_REUSES = REGISTRY.counter(
+    "cidr_manager_reason_reuse_total", "Allocation requests answered with the CIDR already allocated for their reason."
+)
+COMMIT_RETRIES = REGISTRY.counter(
+    "cidr_manager_commit_retries_total", "Commits re-applied because another writer committed (pushed) first."
+)
+COMMIT_FAILURES = REGISTRY.counter(
+    "cidr_manager_commit_failures_total", "Group commits that failed, including ones rejected after every retry."
+)
+FRAGMENTATION = REGISTRY.gauge(
+    "cidr_manager_fragmentation_score", "1 - largest free aligned block / free addresses, by range, as last measured.", ["range"]
+)
+OCCUPIED_ENTRIES = REGISTRY.gauge(
+    "cidr_manager_occupied_entries", "Entries in the most recently loaded or committed occupied list."
+)
+
+@contextmanager
+def methods_context(methods: Tuple[str, ...]) -> Iterator[None]:
+    """Attribute the phases timed inside to the given service methods."""
+    token = _current_methods.set(methods)
+    try:
+        yield
+    finally:
+        _current_methods.reset(token)
+
+@contextmanager
+def request_timing() -> Iterator[Dict[str, float]]:
+    """
+    Collect the time spent in each phase while handling one request.
+
+    Yields the phase to seconds totals, filled in by every phase() timed in
+    this context or in contexts copied from it, e.g. on the service threads.
+    """
+    timings: Dict[str, float] = {}
+    token = _request_timings.set((timings,))
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+@contextmanager
+def group_context(contexts: Iterable[contextvars.Context]) -> Iterator[None]:
+    """
+    Attribute the phases timed inside to everything the given contexts run on
+    behalf of - their service methods and their requests' timings.
+    """
+    methods: Dict[str, None] = {}
+    timings: Dict[int, Dict[str, float]] = {}
+    for context in contexts:
+        methods.update(dict.fromkeys(context.get(_current_methods, ())))
+        timings.update((id(sink), sink) for sink in context.get(_request_timings, ()))
+
+    methods_token = _current_methods.set(tuple(methods))
+    timings_token = _request_timings.set(tuple(timings.values()))
+    try:
+        yield
+    finally:
+        _request_timings.reset(timings_token)
+        _current_methods.reset(methods_token)
+
+def record_timing(name: str, elapsed: float) -> None:
+    """Add time to a phase of the current request's timings, if they are being collected."""
+    for timings in _request_timings.get():
+        timings[name] = timings.get(name, 0.0) + elapsed
+
+@contextmanager
+def request_phase(name: str) -> Iterator[None]:
+    """Time part of a request handled outside the service methods, e.g. rendering its response."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, time.perf_counter() - start)
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """
+    Time a phase of the current service methods.
+
+    Outside of any service method (e.g. the background sync) the phase is
+    recorded under the method "background".
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for method in _current_methods.get() or ("background",):
+            PHASE_SECONDS.observe(elapsed, method=method, phase=name)
+        record_timing(name, elapsed)
+
+def instrumented(method: str) -> Callable:
+    """Decorator recording a service method's latency and attributing the phases it runs to it."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                with methods_context((method,)):
+                    return func(*args, **kwargs)
+            finally:
+                METHOD_SECONDS.observe(time.perf_counter() - start, method=method)
+        return wrapper
+    return decorator
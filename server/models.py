@@ -88,6 +88,89 @@ class CIDRResponse(BaseModel):
         except ValueError:
             raise ValueError(f"Invalid CIDR format: {v}")
 
+class BatchCIDRItem(BaseModel):
+    """A single allocation within a batch CIDR request."""
+    
+    subnet_size: int = Field(
+        ...,
+        description="Subnet size (CIDR prefix length)",
+        example=24
+    )
+    required_range: str = Field(
+        ...,
+        description="Range identifier from addresses-range.json",
+        example="10"
+    )
+    reason: str = Field(
+        ...,
+        min_length=1,
+        description="Reason for CIDR allocation (no whitespaces recommended)",
+        example="web-server-prod"
+    )
+
+class BatchCIDRRequest(BaseModel):
+    """Request model for allocating several CIDRs in one commit."""
+    
+    items: List[BatchCIDRItem] = Field(
+        ...,
+        min_length=1,
+        description="Allocations to make, in order"
+    )
+
+class BatchCIDRResult(BaseModel):
+    """Outcome of a single allocation within a batch."""
+    
+    reason: str = Field(..., description="Reason given for the allocation")
+    cidr: Optional[str] = Field(None, description="Allocated or previously allocated CIDR block", example="10.0.1.0/24")
+    reused: bool = Field(False, description="True if the reason was already used and its existing CIDR was returned")
+    error: Optional[str] = Field(None, description="Why the allocation failed, if it did")
+
+class BatchCIDRResponse(BaseModel):
+    """Response model for batch CIDR allocation."""
+    
+    results: List[BatchCIDRResult] = Field(..., description="Per-item results, in request order")
+
+class CIDRConflict(BaseModel):
+    """Model for a candidate CIDR that overlaps occupied CIDRs."""
+    
+    cidr: str = Field(..., description="Candidate CIDR block", example="10.0.1.0/24")
+    overlaps: Dict[str, str] = Field(..., description="Occupied keys and CIDRs the candidate overlaps")
+
+class ConflictCheckResponse(BaseModel):
+    """Model for bulk conflict check responses."""
+    
+    checked: int = Field(..., description="Number of candidate CIDRs checked")
+    conflicts: List[CIDRConflict] = Field(..., description="Conflicting candidates, in request order")
+    invalid: List[str] = Field(..., description="Candidates that are not valid CIDRs")
+
+class RangeFragmentation(BaseModel):
+    """Model for the free-space fragmentation of a range."""
+    
+    network: str = Field(..., description="Network of the range", example="10.0.0.0/8")
+    free_addresses: int = Field(..., description="Addresses not covered by any occupied CIDR")
+    largest_free_block: Optional[str] = Field(None, description="Prefix length of the largest free aligned block", example="/9")
+    largest_free_addresses: int = Field(..., description="Addresses in the largest free aligned block")
+    fragmentation: float = Field(..., description="1 - largest free block / free addresses; 0 when the free space is one block")
+
+class FragmentationResponse(BaseModel):
+    """Model for fragmentation report responses."""
+    
+    strategy: str = Field(..., description="Allocation strategy in use", example="best-fit")
+    ranges: Dict[str, RangeFragmentation] = Field(..., description="Fragmentation per range key")
+
+class RangeFreeBlocks(BaseModel):
+    """Model for the free blocks of a range."""
+    
+    network: str = Field(..., description="Network of the range", example="10.0.0.0/8")
+    largest: List[str] = Field(..., description="Largest free aligned blocks, largest first", example=["10.128.0.0/9", "10.64.0.0/10"])
+    free_cidr_count: int = Field(..., description="Number of maximal free CIDRs in the range")
+    free_cidrs: List[str] = Field(..., description="Maximal free CIDRs in address order, up to the requested limit")
+
+class FreeBlocksResponse(BaseModel):
+    """Model for largest free block responses."""
+    
+    ranges: Dict[str, RangeFreeBlocks] = Field(..., description="Free blocks per range key")
+
 class SubnetRequest(BaseModel):
     """Request model for subnet calculation."""
     
@@ -264,8 +347,12 @@ class RangeInfo(BaseModel):
     
     range_id: str = Field(..., description="Range identifier", example="10")
     network: str = Field(..., description="Network CIDR", example="10.0.0.0/8")
-    description: str = Field(..., description="Range description", example="Class A private range")
+    description: Optional[str] = Field(None, description="Range description", example="Class A private range")
     total_addresses: int = Field(..., description="Total available addresses")
+    allocated: int = Field(0, description="Number of occupied CIDRs in the range")
+    used_addresses: int = Field(0, description="Addresses covered by occupied CIDRs")
+    free_addresses: int = Field(0, description="Addresses not covered by any occupied CIDR")
+    utilization: float = Field(0.0, description="Used addresses as a percentage of the range")
 
 class CIDRStatistics(BaseModel):
     """Statistics about CIDR usage."""
@@ -274,3 +361,5 @@ class CIDRStatistics(BaseModel):
     by_range: Dict[str, int] = Field(..., description="Allocation count by range")
     by_subnet_size: Dict[str, int] = Field(..., description="Allocation count by subnet size")
     last_allocation: Optional[str] = Field(None, description="Timestamp of last allocation")
+    last_allocation_key: Optional[str] = Field(None, description="Occupied key of the last allocation", example="web-server-prod-1694123456")
+    ranges: List[RangeInfo] = Field(default_factory=list, description="Address usage per range")
@@ -0,0 +1,100 @@
+"""
+Sampling profiler for diagnosing individual slow requests.
+
+The work of a request is spread over the event loop, the service thread pool
+and the commit coalescer, so a deterministic profiler attached to one thread
+would miss most of it. Instead a background thread periodically takes the
+stack of every busy thread from sys._current_frames() and counts the
+functions on it. Threads idling in the standard library's queue and wait
+loops are skipped; anything else running at the same time (such as other
+requests) is sampled as well, which is why this is only offered in debug mode.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set
+
+# Files whose frames at the top of a stack mean the thread is idle
+_IDLE_FILES = tuple(
+    os.path.join(os.path.dirname(threading.__file__), name)
+    for name in ("threading.py", "queue.py", "selectors.py", os.path.join("concurrent", "futures", "thread.py"))
+)
+
+class SamplingProfiler:
+    """Counts the functions on the stacks of busy threads at a fixed interval."""
+
+    def __init__(self, interval: float = 0.001):
+        """
+        Args:
+            interval: Seconds between samples
+        """
+        self.interval = interval
+        self.samples = 0
+        self.duration = 0.0
+        self._started_at = 0.0
+        self._total: Counter = Counter()
+        self._self: Counter = Counter()
+        self._ignored: Set[int] = set()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start sampling, ignoring the calling thread."""
+        self._ignored = {threading.get_ident()}
+        self._stop_event.clear()
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampler thread to finish."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.duration = time.perf_counter() - self._started_at
+
+    def _run(self) -> None:
+        self._ignored.add(threading.get_ident())
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id in self._ignored or frame.f_code.co_filename.startswith(_IDLE_FILES):
+                    continue
+
+                self.samples += 1
+                self._self[self._describe(frame)] += 1
+                # Each function counts once per sample, however deep it recurses;
+                # the thread start-up frames below every stack are left out
+                seen = set()
+                while frame is not None:
+                    name = self._describe(frame)
+                    if name not in seen and not frame.f_code.co_filename.startswith(_IDLE_FILES):
+                        seen.add(name)
+                        self._total[name] += 1
+                    frame = frame.f_back
+
+    @staticmethod
+    def _describe(frame) -> str:
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+
+    def top(self, limit: int = 25) -> List[Dict[str, Any]]:
+        """
+        The functions seen in the most samples.
+
+        Returns:
+            List[Dict[str, Any]]: Function, samples it was anywhere on the stack
+                (total) and at the top of it (self), and total as a percentage
+        """
+        return [
+            {
+                "function": name,
+                "total": total,
+                "self": self._self[name],
+                "percent": round(total / self.samples * 100, 1) if self.samples else 0.0
+            }
+            for name, total in self._total.most_common(limit)
+        ]
@@ -9,91 +9,652 @@ import time
 import json
 import os
 import logging
-from typing import Dict, List, Any, Optional, Union
+import random
+import threading
+import heapq
+from typing import Dict, Iterator, List, Any, Optional, Tuple, Union
+from contextlib import contextmanager
 from pathlib import Path
-from ipaddress import IPv4Network
-from git import Repo
+from itertools import islice
+from ipaddress import IPv4Address, IPv4Network
+from io import BytesIO
+from git import Actor, Blob, Commit, PushInfo, Repo, Tree
+from git.objects.fun import tree_entries_from_data, tree_to_stream
+from gitdb import IStream
 
 from config import get_settings
+from allocator import aligned_blocks, fragmentation, size_class_zone
+from state import OccupiedSnapshot, format_cidr
+from storage import SharedSnapshotCache, SQLiteStorage, StorageBackend, StorageConflictError
+from locking import ProcessLock
+from coalescer import CommitCoalescer, PendingMutation
+import metrics
+import vectorized
 
 logger = logging.getLogger(__name__)
 
+# Times the backoff between retried commits is doubled at most
+MAX_BACKOFF_DOUBLINGS = 4
+
+class PushRejectedError(StorageConflictError):
+    """Raised when the remote rejects a push because it has moved ahead."""
+
 class GitManager:
-    """Handles Git operations for the CIDR management system."""
+    """
+    Handles Git operations for the CIDR management system.
+    
+    The clone is used as an object store: the occupied file is read from the
+    HEAD commit, and changes are committed by writing blob, tree and commit
+    objects and moving the branch ref, without checking files out or going
+    through the index. Its working tree is therefore not kept up to date.
+    """
     
     def __init__(self):
         self.settings = get_settings()
         self.dest = self.settings.git_dest_dir
-        self.occupied_file_path = Path(self.dest) / self.settings.occupied_file
         
+        # Changes appended since the occupied file was last compacted, see GitStorage
+        self.journal_file = f"{self.settings.occupied_file}.journal"
+        
+        # Versions of the checkout, used to tell whether the occupied state changed
+        self.head_sha: Optional[str] = None
+        self.occupied_version: Optional[str] = None
+        
+        # Monotonic time of the last successful fetch from the remote
+        self.last_sync: Optional[float] = None
+        
+        # Long-lived handle, so git's object reader processes are reused between calls
+        self._repo: Optional[Repo] = None
+        self._committer = Actor(self.settings.committer_name, self.settings.committer_email)
+        
+        # Serializes everything that touches the repository within this process...
+        self.lock = threading.RLock()
+        
+        # ...and, with several worker processes sharing the clone, everything that writes to it
+        self.process_lock = ProcessLock(f"{self.dest}.lock")
+        
+        # Fetches only move remote-tracking refs, so they take a lock of their
+        # own and a separate handle, and nothing waits on the network for them
+        self.fetch_lock = ProcessLock(f"{self.dest}.fetch.lock")
+        self._fetch_repo: Optional[Repo] = None
+    
+    def _open(self) -> Repo:
+        if self._repo is None:
+            self._repo = Repo(self.dest)
+        return self._repo
+    
+    @contextmanager
+    def _locked(self, blocking: bool = True) -> Iterator[bool]:
+        """
+        Hold the repository lock, across worker processes too.
+        
+        Yields whether it was acquired, which without blocking is only the
+        case if nobody else held it.
+        """
+        if not self.lock.acquire(blocking):
+            yield False
+            return
+        try:
+            acquired = self.process_lock.acquire(blocking)
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    self.process_lock.release()
+        finally:
+            self.lock.release()
+    
+    def _fetch(self, blocking: bool = True) -> bool:
+        """
+        Fetch from the remote, holding only the fetch lock.
+        
+        Args:
+            blocking: Wait for a fetch or push in progress. Without it, no
+                fetch is made while one is - it brings in the same commits
+        
+        Returns:
+            bool: Whether the fetch was made
+        """
+        if not self.fetch_lock.acquire(blocking):
+            return False
+        try:
+            if self._fetch_repo is None:
+                # Not shared with the repository lock holders, nor are git's object reader processes
+                self._fetch_repo = Repo(self.dest)
+            self._fetch_repo.remotes.origin.fetch()
+        finally:
+            self.fetch_lock.release()
+        return True
+    
+    def _record_head(self, repo: Repo) -> None:
+        """Remember the HEAD commit and the occupied file and journal blobs it points at."""
+        try:
+            commit = repo.head.commit
+        except ValueError:
+            # Empty repository without any commits yet
+            self.head_sha = None
+            self.occupied_version = None
+            return
+        
+        self.head_sha = commit.hexsha
+        blobs = []
+        for path in (self.settings.occupied_file, self.journal_file):
+            try:
+                blobs.append((commit.tree / path).hexsha)
+            except KeyError:
+                blobs.append("")
+        self.occupied_version = ":".join(blobs) if blobs[0] else None
+    
+    def _clone(self) -> Repo:
+        """
+        Clone the repository in the configured mode, without a checkout.
+        
+        shallow only fetches the last git_clone_depth commits, blobless fetches
+        file contents on demand, and sparse combines both so that only the
+        occupied file and its journal are ever downloaded. Later fetches keep
+        the clone that way - they only bring in the commits made since.
+        """
+        mode = self.settings.git_clone_mode
+        options: Dict[str, Any] = {"no_checkout": True}
+        if mode in ("shallow", "sparse"):
+            options.update(depth=self.settings.git_clone_depth, single_branch=True)
+        if mode in ("blobless", "sparse"):
+            options["filter"] = "blob:none"
+        
+        return Repo.clone_from(self.settings.https_remote_url, self.dest, **options)
+    
+    def _fast_forward(self, repo: Repo) -> None:
+        """Move the local branch to the remote-tracking branch if it is ahead."""
+        upstream = repo.active_branch.tracking_branch()
+        if upstream is None or not upstream.is_valid():
+            # Nothing has been pushed to the remote yet
+            return
+        
+        try:
+            head = repo.head.commit
+        except ValueError:
+            head = None
+        if head == upstream.commit:
+            return
+        
+        if head is not None and not repo.is_ancestor(head, upstream.commit):
+            # Local commits that never made it to the remote - the remote wins
+            logger.warning("Local branch has diverged from the remote branch - resetting to it")
+        repo.head.set_commit(upstream.commit, logmsg=f"fast-forward to {upstream.name}")
+    
     def clone_or_pull(self) -> None:
         """Clone repository or pull latest changes if it already exists."""
+        with self.lock, self.process_lock:
+            try:
+                if Path(self.dest).exists():
+                    logger.info("Repository already exists - pulling latest changes")
+                    repo = self._open()
+                    self._fetch()
+                    self._fast_forward(repo)
+                else:
+                    logger.info(f"Cloning repository ({self.settings.git_clone_mode} clone)")
+                    repo = self._repo = self._clone()
+                    logger.info("Repository cloned successfully")
+                self._record_head(repo)
+                self.last_sync = time.monotonic()
+            except Exception as e:
+                logger.error(f"Git error occurred: {e}")
+                raise Exception(f"Failed to clone/pull repository: {e}")
+    
+    def sync(self, fetch: bool = True, wait: bool = True) -> None:
+        """
+        Bring the checkout up to date with the remote-tracking branch.
+        
+        The fetch runs without the repository lock, so requests and commits
+        carry on during the network round trip - the lock is only taken to
+        fast-forward the branch and record the new HEAD.
+        
+        Args:
+            fetch: Fetch from the remote first. Without it only the commits
+                fetched by earlier syncs are fast-forwarded, which needs no
+                network round trip.
+            wait: Wait for a fetch in progress, and for the repository lock
+                if e.g. a commit is being pushed. Without it, whatever is
+                already fetched is used and the fast-forward is left to the
+                next sync if the lock is taken.
+        """
+        if self._repo is None:
+            # Not opened yet - the clone may not exist, or still be in the making
+            self.clone_or_pull()
+            return
+        
         try:
-            if Path(self.dest).exists():
-                logger.info("Repository already exists - pulling latest changes")
-                repo = Repo(self.dest)
-                repo.remotes.origin.pull()
-            else:
-                logger.info("Cloning repository")
-                Repo.clone_from(self.settings.https_remote_url, self.dest)
-                logger.info("Repository cloned successfully")
+            if fetch and self._fetch(blocking=wait):
+                self.last_sync = time.monotonic()
+            
+            with self._locked(wait) as locked:
+                if not locked:
+                    logger.info("Repository is locked - fast-forwarding on the next sync")
+                    return
+                repo = self._open()
+                self._fast_forward(repo)
+                self._record_head(repo)
         except Exception as e:
             logger.error(f"Git error occurred: {e}")
-            raise Exception(f"Failed to clone/pull repository: {e}")
+            raise Exception(f"Failed to sync repository: {e}")
+    
+    def reset_to_remote(self) -> None:
+        """
+        Fetch the commits another writer pushed and reset onto them.
         
-        # Ensure occupied file exists
-        if not self.occupied_file_path.exists():
-            logger.info("Creating empty occupied CIDRs file")
-            self.occupied_file_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.occupied_file_path, 'w') as file:
-                json.dump({}, file)
+        Local commits the remote rejected are dropped - their changes are
+        expected to be re-applied on top of the new remote state.
+        """
+        with self.lock, self.process_lock:
+            try:
+                repo = self._open()
+                self._fetch()
+                self.last_sync = time.monotonic()
+                self._fast_forward(repo)
+                self._record_head(repo)
+            except Exception as e:
+                logger.error(f"Git error occurred: {e}")
+                raise Exception(f"Failed to reset to remote branch: {e}")
     
-    def push_changes(self, commit_message: str) -> None:
-        """Commit and push changes to the repository."""
+    def refresh_head(self) -> None:
+        """
+        Pick up commits other worker processes made to the shared clone, without fetching.
+        
+        Skipped while a commit in this process holds the repository lock.
+        """
+        if not self.lock.acquire(blocking=False):
+            return
         try:
-            repo = Repo(self.dest)
-            
-            # Configure git user
-            with repo.config_writer() as config:
-                config.set_value('user', 'name', self.settings.committer_name)
-                config.set_value('user', 'email', self.settings.committer_email)
-            
-            # Add, commit, and push
-            repo.index.add([self.settings.occupied_file])
-            repo.index.commit(commit_message)
-            origin = repo.remote('origin')
-            origin.push().raise_if_error()
-            
-            logger.info(f"Changes pushed successfully: {commit_message}")
+            repo = self._open()
+            try:
+                head = repo.head.commit.hexsha
+            except ValueError:
+                head = None
+            if head != self.head_sha:
+                self._record_head(repo)
         except Exception as e:
-            logger.error(f"Failed to push changes: {e}")
-            raise Exception(f"Failed to push changes to repository: {e}")
+            logger.error(f"Git error occurred: {e}")
+            raise Exception(f"Failed to read repository HEAD: {e}")
+        finally:
+            self.lock.release()
+    
+    def sync_age(self) -> Optional[float]:
+        """Seconds since the last successful fetch, or None if never fetched."""
+        if self.last_sync is None:
+            return None
+        return time.monotonic() - self.last_sync
+    
+    def read_file(self, path: str) -> Optional[bytes]:
+        """Read a file as of the HEAD commit, or None if it does not exist there."""
+        with self.lock:
+            try:
+                return (self._open().head.commit.tree / path).data_stream.read()
+            except (KeyError, ValueError):
+                return None
+    
+    def _store(self, repo: Repo, object_type: str, data: bytes) -> bytes:
+        """Write an object to the object database and return its binary SHA."""
+        return repo.odb.store(IStream(object_type, len(data), BytesIO(data))).binsha
+    
+    def _write_tree(self, repo: Repo, tree_sha: Optional[bytes], path: List[str], blob_sha: bytes) -> bytes:
+        """Store a copy of a tree with the blob at path replaced, returning the new tree's SHA."""
+        entries = []
+        if tree_sha is not None:
+            entries = tree_entries_from_data(repo.odb.stream(tree_sha).read())
+        
+        name = path[0]
+        existing = next((entry for entry in entries if entry[2] == name), None)
+        entries = [entry for entry in entries if entry[2] != name]
+        if len(path) == 1:
+            entries.append((blob_sha, Blob.file_mode, name))
+        else:
+            subtree_sha = existing[0] if existing is not None and existing[1] == Tree.tree_id << 12 else None
+            entries.append((self._write_tree(repo, subtree_sha, path[1:], blob_sha), Tree.tree_id << 12, name))
+        
+        # Git orders tree entries by name, with directories compared as if ending in '/'
+        entries.sort(key=lambda entry: entry[2].encode() + (b"/" if entry[1] == Tree.tree_id << 12 else b""))
+        
+        stream = BytesIO()
+        tree_to_stream(entries, stream.write)
+        return self._store(repo, Tree.type, stream.getvalue())
+    
+    def push_changes(self, files: Dict[str, bytes], commit_message: str) -> None:
+        """
+        Commit new contents of files on top of HEAD and push the commit.
+        
+        Args:
+            files: Repository-relative paths and their new contents
+            commit_message: Message of the commit
+            
+        Raises:
+            StorageConflictError: If HEAD moved since it was last recorded, i.e.
+                another worker process committed to the clone in the meantime
+            PushRejectedError: If the remote has commits the clone does not
+        """
+        with self.lock, self.process_lock:
+            try:
+                repo = self._open()
+                try:
+                    parent = repo.head.commit
+                except ValueError:
+                    # First commit of an empty repository
+                    parent = None
+                
+                if (parent.hexsha if parent is not None else None) != self.head_sha:
+                    raise StorageConflictError("Local branch moved since the occupied state was loaded")
+                
+                tree_sha = parent.tree.binsha if parent is not None else None
+                for path, content in files.items():
+                    blob_sha = self._store(repo, Blob.type, content)
+                    tree_sha = self._write_tree(repo, tree_sha, path.split('/'), blob_sha)
+                
+                commit = Commit.create_from_tree(
+                    repo, Tree(repo, tree_sha), commit_message,
+                    parent_commits=[parent] if parent is not None else [],
+                    author=self._committer, committer=self._committer
+                )
+                branch = repo.head.reference
+                if parent is None:
+                    repo.create_head(branch.name, commit)
+                else:
+                    repo.head.set_commit(commit, logmsg=f"commit: {commit.summary}")
+                self._record_head(repo)
+                
+                origin = repo.remote('origin')
+                try:
+                    # Pushing also moves the remote-tracking ref, which a fetch may be updating
+                    with self.fetch_lock:
+                        push_infos = origin.push(f"{branch.path}:{branch.path}")
+                    if any(info.flags & (PushInfo.REJECTED | PushInfo.REMOTE_REJECTED) for info in push_infos):
+                        raise PushRejectedError("Remote branch has moved ahead")
+                    push_infos.raise_if_error()
+                    if branch.tracking_branch() is None:
+                        branch.set_tracking_branch(origin.refs[branch.name])
+                except Exception:
+                    # Never keep a commit the remote does not have - later syncs could not reconcile it
+                    if parent is not None:
+                        repo.head.set_commit(parent, logmsg="reset: push failed")
+                    self._fast_forward(repo)
+                    self._record_head(repo)
+                    raise
+                
+                logger.info(f"Changes pushed successfully: {commit_message}")
+            except PushRejectedError:
+                logger.warning(f"Push rejected, remote has new commits: {commit_message}")
+                raise
+            except StorageConflictError:
+                logger.warning(f"Commit rejected, another worker committed first: {commit_message}")
+                raise
+            except Exception as e:
+                logger.error(f"Failed to push changes: {e}")
+                raise Exception(f"Failed to push changes to repository: {e}")
 
-class CIDRService:
-    """Service for managing CIDR allocations."""
+class GitStorage(StorageBackend):
+    """Occupied state kept as a JSON file in the occupied repository."""
     
     def __init__(self):
         self.settings = get_settings()
         self.git_manager = GitManager()
-        self.addresses_file = Path("addresses-range.json")
+        self.lock = self.git_manager.lock
         
+        # Parsed occupied state, reused until the repository version changes.
+        # Read requests use it without any lock, so it is never mutated once
+        # published here - writers get a copy, which replaces it when committed
+        self._snapshot: Optional[OccupiedSnapshot] = None
+        
+        # Journal of the loaded occupied state and its number of lines
+        self._journal = b""
+        self._journal_entries = 0
+        
+        # Parsed state shared with the other worker processes, if there are any
+        self._shared_cache: Optional[SharedSnapshotCache] = None
+        if self.settings.workers > 1:
+            self._shared_cache = SharedSnapshotCache(f"{self.settings.git_dest_dir}.snapshot")
+    
+    def mutation_lock(self) -> ProcessLock:
+        # Worker processes take turns committing rather than rejecting each other's commits
+        return self.git_manager.process_lock
+    
     def _load_occupied_cidrs(self) -> Dict[str, str]:
-        """Load occupied CIDRs from file."""
+        """Load occupied CIDRs from HEAD, replaying the journal on top if there is one."""
+        data = self.git_manager.read_file(self.settings.occupied_file)
         try:
-            with open(self.git_manager.occupied_file_path, 'r') as file:
-                return json.load(file)
+            if data is None:
+                raise FileNotFoundError(f"{self.settings.occupied_file} not found at HEAD")
+            occupied = json.loads(data)
         except (FileNotFoundError, json.JSONDecodeError) as e:
             logger.warning(f"Could not load occupied CIDRs: {e}")
-            return {}
+            occupied = {}
+        
+        self._journal = self.git_manager.read_file(self.git_manager.journal_file) or b""
+        self._journal_entries = 0
+        for line_number, line in enumerate(self._journal.decode().splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                # Same ordering as OccupiedSnapshot.add - a re-added key moves to the end
+                occupied.pop(entry["key"], None)
+                if entry["op"] == "add":
+                    occupied[entry["key"]] = entry["cidr"]
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                raise Exception(f"Invalid entry on line {line_number} of {self.git_manager.journal_file}: {e}")
+            self._journal_entries += 1
+        
+        return occupied
+    
+    def _write_changes(self, snapshot: OccupiedSnapshot) -> Dict[str, bytes]:
+        """Get the new contents of the files to commit for the snapshot's changes, in the configured format."""
+        changes = snapshot.take_changes()
+        journal_size = self._journal_entries + len(changes)
+        if self.settings.occupied_format == "journal" and journal_size <= self.settings.journal_compact_entries:
+            # Append the changes to the journal, one JSON object per line
+            lines = "".join(json.dumps({"op": action, "key": key, "cidr": cidr}) + "\n" for action, key, cidr in changes)
+            self._journal += lines.encode()
+            self._journal_entries = journal_size
+            return {self.git_manager.journal_file: self._journal}
+        
+        # Compact - rewrite the whole file and empty the journal
+        files = {self.settings.occupied_file: json.dumps(snapshot.to_dict(), indent=4).encode()}
+        if self._journal:
+            files[self.git_manager.journal_file] = b""
+        self._journal = b""
+        self._journal_entries = 0
+        return files
+    
+    def _refresh_for_read(self) -> None:
+        """Make the checkout fresh enough to serve a read-only request."""
+        if self.settings.sync_interval_seconds <= 0:
+            self.git_manager.sync(wait=False)
+            return
+        
+        # The background sync keeps the checkout fresh - only fetch here if it fell behind
+        age = self.git_manager.sync_age()
+        max_staleness = self.settings.max_staleness_seconds
+        if age is None or (max_staleness > 0 and age > max_staleness):
+            logger.info("Repository snapshot is stale - syncing before read")
+            self.git_manager.sync(wait=False)
+        elif self.settings.workers > 1:
+            self.git_manager.refresh_head()
+    
+    def _refresh_for_write(self) -> None:
+        """Bring the checkout up to date before applying a mutation."""
+        if self.settings.sync_interval_seconds <= 0:
+            self.git_manager.clone_or_pull()
+        else:
+            self.git_manager.sync(fetch=False)
     
-    def _save_occupied_cidrs(self, occupied: Dict[str, str]) -> None:
-        """Save occupied CIDRs to file."""
+    def _get_snapshot(self) -> OccupiedSnapshot:
+        """Get the parsed occupied state for the current checkout, reusing the cached one if possible."""
+        head = self.git_manager.head_sha
+        version = self.git_manager.occupied_version
+        snapshot = self._snapshot
+        
+        if snapshot is not None and head is not None:
+            if snapshot.head == head:
+                return snapshot
+            if version is not None and snapshot.version == version:
+                # HEAD moved but the occupied file and journal are unchanged
+                snapshot.head = head
+                return snapshot
+        
+        with metrics.phase("load"):
+            cached = self._shared_cache.load(head, version) if self._shared_cache is not None else None
+            if cached is not None:
+                logger.info(f"Loading occupied CIDRs at commit {head} from the shared cache")
+                snapshot, (self._journal, self._journal_entries) = cached
+            else:
+                logger.info(f"Loading occupied CIDRs at commit {head}")
+                snapshot = OccupiedSnapshot(self._load_occupied_cidrs(), head, version)
+                if self._shared_cache is not None:
+                    self._shared_cache.store(snapshot, (self._journal, self._journal_entries))
+        self._snapshot = snapshot
+        metrics.OCCUPIED_ENTRIES.set(len(snapshot))
+        return snapshot
+    
+    def read_snapshot(self) -> OccupiedSnapshot:
+        with metrics.phase("sync"):
+            self._refresh_for_read()
+        
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self.lock:
+                return self._get_snapshot()
+        
+        # Loading a new version reads the repository. While a commit holds it,
+        # the last committed snapshot is served rather than waiting for the push
+        if snapshot.head == self.git_manager.head_sha or not self.lock.acquire(blocking=False):
+            return snapshot
         try:
-            with open(self.git_manager.occupied_file_path, 'w') as file:
-                json.dump(occupied, file, indent=4)
-        except Exception as e:
-            logger.error(f"Failed to save occupied CIDRs: {e}")
-            raise Exception(f"Failed to save occupied CIDRs: {e}")
+            return self._get_snapshot()
+        finally:
+            self.lock.release()
+    
+    def cached_snapshot(self, max_age: float) -> OccupiedSnapshot:
+        snapshot = self._snapshot
+        age = self.git_manager.sync_age()
+        if snapshot is not None and snapshot.head == self.git_manager.head_sha and age is not None and age <= max_age:
+            return snapshot
+        return self.read_snapshot()
+    
+    def write_snapshot(self, retry: bool = False) -> OccupiedSnapshot:
+        with metrics.phase("sync"):
+            if retry:
+                # Rebuild on top of what the other writer pushed
+                self.git_manager.reset_to_remote()
+            else:
+                self._refresh_for_write()
+        return self._get_snapshot().copy()
+    
+    def commit(self, snapshot: OccupiedSnapshot, message: str) -> None:
+        """Save the mutated snapshot, commit and push it, and publish it to read requests."""
+        journal = self._journal, self._journal_entries
+        try:
+            with metrics.phase("save"):
+                files = self._write_changes(snapshot)
+            with metrics.phase("push"):
+                self.git_manager.push_changes(files, message)
+        except Exception:
+            # The published snapshot was never touched, but the journal was extended
+            self._journal, self._journal_entries = journal
+            raise
+        
+        snapshot.head = self.git_manager.head_sha
+        snapshot.version = self.git_manager.occupied_version
+        metrics.OCCUPIED_ENTRIES.set(len(snapshot))
+        if self._shared_cache is not None:
+            self._shared_cache.store(snapshot, (self._journal, self._journal_entries))
+        self._snapshot = snapshot
+
+class CIDRService:
+    """Service for managing CIDR allocations."""
+    
+    def __init__(self):
+        self.settings = get_settings()
+        self.storage = self._create_storage()
+        self.addresses_file = Path("addresses-range.json")
+        
+        # Concurrent mutations share commits and pushes
+        self.commit_coalescer = CommitCoalescer(
+            self._apply_mutations,
+            window_seconds=self.settings.commit_window_ms / 1000
+        )
+    
+    def _create_storage(self) -> StorageBackend:
+        """Create the storage backend selected by the storage_backend setting."""
+        if self.settings.storage_backend == "sqlite":
+            return SQLiteStorage(self.settings.sqlite_path)
+        return GitStorage()
+    
+    def _apply_mutations(self, mutations: List[PendingMutation]) -> None:
+        """
+        Apply a group of mutations in order and record them with one commit.
+        
+        Each mutation is called with the occupied snapshot and returns its
+        result along with the commit message lines for the changes it made.
+        Its future is resolved once the commit has been pushed.
+        
+        If another writer committed first (for git, pushed first), its changes
+        are loaded and every mutation is re-applied on top of them, so
+        allocations avoid whatever the other writer took. This is retried up
+        to push_max_retries times - the first time straight away, since the
+        other writer's changes have just been fetched, then with backoff.
+        """
+        # The shared sync, load, save and push phases count towards every method and request in the group
+        try:
+            with metrics.group_context(mutation.context for mutation in mutations):
+                outcomes = self._commit_with_retries(mutations)
+        except Exception:
+            metrics.COMMIT_FAILURES.inc()
+            raise
+        
+        for mutation, result, error in outcomes:
+            if error is not None:
+                mutation.future.set_exception(error)
+            else:
+                mutation.future.set_result(result)
+    
+    def _commit_with_retries(self, mutations: List[PendingMutation]) -> List[Tuple[PendingMutation, Any, Optional[Exception]]]:
+        """Apply and commit a group of mutations, re-applying them after a conflict."""
+        max_retries = self.settings.push_max_retries
+        for attempt in range(max_retries + 1):
+            with self.storage.lock, self.storage.mutation_lock():
+                snapshot = self.storage.write_snapshot(retry=attempt > 0)
+                
+                outcomes = []
+                messages = []
+                for mutation in mutations:
+                    try:
+                        # In the caller's context, so e.g. its search phase is attributed to it
+                        result, changes = mutation.context.run(mutation.apply, snapshot)
+                    except Exception as e:
+                        outcomes.append((mutation, None, e))
+                        continue
+                    outcomes.append((mutation, result, None))
+                    messages.extend(changes)
+                
+                try:
+                    if messages:
+                        if len(messages) == 1:
+                            commit_message = messages[0]
+                        else:
+                            commit_message = f"Recorded {len(messages)} CIDR changes\n\n" + "\n".join(messages)
+                        self.storage.commit(snapshot, commit_message)
+                    return outcomes
+                except StorageConflictError:
+                    if attempt == max_retries:
+                        raise Exception(f"Failed to push changes to repository: rejected after {max_retries} retries")
+            
+            metrics.COMMIT_RETRIES.inc()
+            if attempt == 0:
+                # Most conflicts are a single other writer, so re-apply on top of it right away
+                logger.info(f"Retrying rejected commit (attempt 1 of {max_retries})")
+                continue
+            
+            # Back off outside the lock with jitter so competing writers spread out
+            delay = self.settings.push_retry_backoff_ms / 1000 * (2 ** min(attempt - 1, MAX_BACKOFF_DOUBLINGS)) * random.uniform(0.5, 1.5)
+            logger.info(f"Retrying rejected commit in {delay:.3f}s (attempt {attempt + 1} of {max_retries})")
+            time.sleep(delay)
     
     def _load_address_ranges(self) -> Dict[str, str]:
         """Load available address ranges from configuration."""
@@ -111,39 +672,58 @@ class CIDRService:
             logger.error(f"Invalid JSON in addresses-range.json: {e}")
             raise ValueError("Invalid address ranges configuration")
     
-    def _get_next_available_subnet(self, range_key: str, subnet_size: int) -> IPv4Network:
-        """Find the next available subnet in the specified range."""
-        occupied = self._load_occupied_cidrs()
+    def _get_range(self, range_key: str) -> IPv4Network:
+        """Get the network of a range from addresses-range.json."""
         addresses = self._load_address_ranges()
         
         if range_key not in addresses:
             raise ValueError(f"Invalid range key: {range_key}. Available ranges: {list(addresses.keys())}")
         
-        main_range = IPv4Network(addresses[range_key])
-        logger.info(f"Searching for /{subnet_size} subnet in {main_range}")
+        return IPv4Network(addresses[range_key])
+    
+    def _get_next_available_subnet(self, range_key: str, subnet_size: int, snapshot: OccupiedSnapshot) -> IPv4Network:
+        """Find the next available subnet in the specified range, placed by the allocation strategy."""
+        main_range = self._get_range(range_key)
+        strategy = self.settings.allocation_strategy
+        logger.info(f"Searching for /{subnet_size} subnet in {main_range} ({strategy})")
+        
+        with metrics.phase("search"):
+            if strategy == "best-fit":
+                subnet = snapshot.buddy_allocator(range_key, main_range).best_fit(subnet_size)
+            elif strategy == "zoned":
+                subnet = self._zoned_fit(range_key, main_range, subnet_size, snapshot)
+            elif self.settings.allocator_mode == "buddy":
+                subnet = snapshot.buddy_allocator(range_key, main_range).peek(subnet_size)
+            else:
+                subnet = snapshot.index.first_fit(main_range, subnet_size)
         
-        # Get all possible subnets of the requested size
-        for subnet in main_range.subnets(new_prefix=subnet_size):
-            # Check if this subnet overlaps with any occupied CIDR
-            is_occupied = any(
-                IPv4Network(subnet).overlaps(IPv4Network(occupied_cidr))
-                for occupied_cidr in occupied.values()
-            )
-            
-            if not is_occupied:
-                logger.info(f"Found available subnet: {subnet}")
-                return subnet
+        if subnet is not None:
+            logger.info(f"Found available subnet: {subnet}")
+            return subnet
         
-        raise Exception(f"No available /{subnet_size} subnets in range {addresses[range_key]}")
+        raise Exception(f"No available /{subnet_size} subnets in range {main_range}")
     
-    def _check_reason_already_used(self, reason: str, occupied: Dict[str, str]) -> Optional[str]:
+    def _zoned_fit(self, range_key: str, main_range: IPv4Network, subnet_size: int,
+                   snapshot: OccupiedSnapshot) -> Optional[IPv4Network]:
+        """Best fit within the zone of the request's size class, or anywhere in the range once that is full."""
+        if not main_range.prefixlen <= subnet_size <= main_range.max_prefixlen:
+            raise ValueError(f"Invalid subnet size /{subnet_size} for range {main_range}")
+        
+        zone = size_class_zone(main_range, subnet_size)
+        if zone is not None:
+            subnet = snapshot.buddy_allocator(f"{range_key}@{zone}", zone).best_fit(subnet_size)
+            if subnet is not None:
+                return subnet
+            logger.info(f"Zone {zone} has no free /{subnet_size} - falling back to the whole range")
+        return snapshot.buddy_allocator(range_key, main_range).best_fit(subnet_size)
+    
+    def _check_reason_already_used(self, reason: str, snapshot: OccupiedSnapshot) -> Optional[str]:
         """Check if reason was already used and return existing CIDR if found."""
-        for key, cidr in occupied.items():
-            # Remove timestamp suffix to get original reason
-            original_reason = key.rsplit('-', 1)[0] if '-' in key else key
-            if original_reason == reason:
-                logger.info(f"Reason '{reason}' already used, returning existing CIDR: {cidr}")
-                return cidr
+        key = snapshot.find_reason(reason)
+        if key is not None:
+            cidr = snapshot.get(key)
+            logger.info(f"Reason '{reason}' already used, returning existing CIDR: {cidr}")
+            return cidr
         return None
     
     def _validate_reason(self, reason: str) -> None:
@@ -154,24 +734,19 @@ class CIDRService:
         if len(reason.strip()) == 0:
             raise ValueError("Reason cannot be empty after trimming whitespace")
     
-    def _is_valid_cidr(self, cidr: str) -> bool:
-        """Check if a string is a valid CIDR."""
+    def _is_valid_cidr(self, cidr: str, strict: bool = True) -> bool:
+        """Check if a string is a valid CIDR (with strict=False, host bits may be set)."""
         try:
-            IPv4Network(cidr)
+            IPv4Network(cidr, strict=strict)
             return True
         except ValueError:
             return False
     
-    def _check_cidr_overlap(self, cidr: str) -> bool:
+    def _check_cidr_overlap(self, cidr: str, snapshot: OccupiedSnapshot) -> bool:
         """Check if a CIDR overlaps with any existing occupied CIDR."""
-        occupied_cidrs = self._load_occupied_cidrs()
-        given_cidr = IPv4Network(cidr)
-        
-        for occupied_cidr in occupied_cidrs.values():
-            if given_cidr.overlaps(IPv4Network(occupied_cidr)):
-                return True
-        return False
+        return snapshot.index.overlaps(IPv4Network(cidr))
     
+    @metrics.instrumented("get_unique_cidr")
     def get_unique_cidr(self, subnet_size: int, required_range: str, reason: str) -> IPv4Network:
         """
         Get a unique CIDR and mark it as occupied.
@@ -189,36 +764,90 @@ class CIDRService:
             Exception: If no CIDR is available or Git operations fail
         """
         self._validate_reason(reason)
+        reused = False
         
-        # Clone/pull repository
-        self.git_manager.clone_or_pull()
-        
-        # Load current occupied CIDRs
-        occupied = self._load_occupied_cidrs()
-        
-        # Check if reason was already used
-        existing_cidr = self._check_reason_already_used(reason, occupied)
-        if existing_cidr:
-            return IPv4Network(existing_cidr)
+        def allocate(snapshot: OccupiedSnapshot):
+            nonlocal reused
+            # Check if reason was already used
+            existing_cidr = self._check_reason_already_used(reason, snapshot)
+            reused = existing_cidr is not None
+            if existing_cidr:
+                return IPv4Network(existing_cidr), []
+            
+            # Find next available subnet
+            subnet = self._get_next_available_subnet(required_range, subnet_size, snapshot)
+            
+            # Create new entry with timestamp
+            timestamp = int(time.time())
+            key = f"{reason}-{timestamp}"
+            snapshot.add(key, str(subnet))
+            
+            logger.info(f"Allocating CIDR {subnet} for reason '{reason}'")
+            return subnet, [f"Allocated CIDR {subnet} for {reason}"]
         
-        # Find next available subnet
-        subnet = self._get_next_available_subnet(required_range, subnet_size)
+        # Commit and push as part of the next group commit
+        subnet = self.commit_coalescer.submit(allocate)
         
-        # Create new entry with timestamp
-        timestamp = int(time.time())
-        key = f"{reason}-{timestamp}"
-        occupied[key] = str(subnet)
+        # Counted once committed - a retried group commit applies the mutation again
+        if reused:
+            metrics.REASON_REUSES.inc()
+        else:
+            metrics.ALLOCATIONS.inc(range=required_range)
+        return subnet
+    
+    @metrics.instrumented("get_unique_cidrs_batch")
+    def get_unique_cidrs_batch(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Allocate several CIDRs against one snapshot and record them in a single commit.
         
-        # Save to file
-        self._save_occupied_cidrs(occupied)
+        Args:
+            items: Dicts with subnet_size, required_range and reason, allocated in order
+            
+        Returns:
+            List[Dict[str, Any]]: Per-item reason, cidr, reused flag and error message
+            
+        Raises:
+            Exception: If Git operations fail - nothing is allocated in that case
+        """
+        def allocate_batch(snapshot: OccupiedSnapshot):
+            results = []
+            allocated = []
+            timestamp = int(time.time())
+            
+            for item in items:
+                reason = item["reason"]
+                result = {"reason": reason, "cidr": None, "reused": False, "error": None}
+                try:
+                    self._validate_reason(reason)
+                    
+                    # Earlier items of this batch count as already used too
+                    existing_cidr = self._check_reason_already_used(reason, snapshot)
+                    if existing_cidr:
+                        result["cidr"] = str(IPv4Network(existing_cidr))
+                        result["reused"] = True
+                    else:
+                        subnet = self._get_next_available_subnet(item["required_range"], item["subnet_size"], snapshot)
+                        snapshot.add(f"{reason}-{timestamp}", str(subnet))
+                        allocated.append(f"Allocated CIDR {subnet} for {reason}")
+                        result["cidr"] = str(subnet)
+                except Exception as e:
+                    logger.warning(f"Batch allocation failed for reason '{reason}': {e}")
+                    result["error"] = str(e)
+                results.append(result)
+            
+            logger.info(f"Batch allocating {len(allocated)} of {len(items)} requested CIDRs")
+            return results, allocated
         
-        # Commit and push changes
-        commit_message = f"Allocated CIDR {subnet} for {reason}"
-        self.git_manager.push_changes(commit_message)
+        results = self.commit_coalescer.submit(allocate_batch)
         
-        logger.info(f"Successfully allocated CIDR {subnet} for reason '{reason}'")
-        return subnet
+        for item, result in zip(items, results):
+            if result["reused"]:
+                metrics.REASON_REUSES.inc()
+            elif result["cidr"] is not None:
+                metrics.ALLOCATIONS.inc(range=item["required_range"])
+        return results
     
+    @metrics.instrumented("get_next_cidr_no_push")
     def get_next_cidr_no_push(self, subnet_size: int, required_range: str, reason: str) -> IPv4Network:
         """
         Preview the next available CIDR without allocating it.
@@ -233,23 +862,21 @@ class CIDRService:
         """
         self._validate_reason(reason)
         
-        # Clone/pull repository
-        self.git_manager.clone_or_pull()
-        
         # Load current occupied CIDRs
-        occupied = self._load_occupied_cidrs()
+        snapshot = self.storage.read_snapshot()
         
         # Check if reason was already used
-        existing_cidr = self._check_reason_already_used(reason, occupied)
+        existing_cidr = self._check_reason_already_used(reason, snapshot)
         if existing_cidr:
             return IPv4Network(existing_cidr)
         
         # Find next available subnet (but don't allocate it)
-        subnet = self._get_next_available_subnet(required_range, subnet_size)
+        subnet = self._get_next_available_subnet(required_range, subnet_size, snapshot)
         
         logger.info(f"Next available CIDR for reason '{reason}': {subnet}")
         return subnet
     
+    @metrics.instrumented("get_all_occupied")
     def get_all_occupied(self) -> Dict[str, str]:
         """
         Get all occupied CIDR blocks.
@@ -257,50 +884,237 @@ class CIDRService:
         Returns:
             Dict[str, str]: Dictionary of reason-timestamp keys to CIDR values
         """
-        self.git_manager.clone_or_pull()
-        occupied = self._load_occupied_cidrs()
+        snapshot = self.storage.read_snapshot()
+        with metrics.phase("serialize"):
+            occupied = snapshot.to_dict()
         logger.info(f"Retrieved {len(occupied)} occupied CIDRs")
         return occupied
     
-    def delete_cidr_from_list(self, cidr_block: str) -> str:
+    @metrics.instrumented("check_conflicts")
+    def check_conflicts(self, cidrs: List[str]) -> Dict[str, Any]:
         """
-        Delete a CIDR block from the occupied list.
+        Check a list of candidate CIDRs against the occupied list without changing it.
         
         Args:
-            cidr_block: The CIDR block to delete
+            cidrs: Candidate CIDR strings
             
         Returns:
-            str: Success or error message
+            Dict[str, Any]: The conflicting candidates with the occupied keys and
+                CIDRs each overlaps, and the candidates that are not valid CIDRs
         """
-        if not self._is_valid_cidr(cidr_block):
-            raise ValueError(f"Invalid CIDR format: {cidr_block}")
+        networks = []
+        candidates = []
+        invalid = []
+        for cidr in cidrs:
+            if self._is_valid_cidr(cidr):
+                networks.append(IPv4Network(cidr))
+                candidates.append(cidr)
+            else:
+                invalid.append(cidr)
+        
+        snapshot = self.storage.read_snapshot()
+        with metrics.phase("search"):
+            overlaps = self._find_overlaps(networks, snapshot)
+        conflicts = [
+            {"cidr": cidr, "overlaps": {key: snapshot.get(key) for key in keys}}
+            for cidr, keys in zip(candidates, overlaps) if keys
+        ]
+        
+        logger.info(f"Checked {len(cidrs)} CIDRs: {len(conflicts)} conflicting, {len(invalid)} invalid")
+        return {"checked": len(cidrs), "conflicts": conflicts, "invalid": invalid}
+    
+    def _find_overlaps(self, networks: List[IPv4Network], snapshot: OccupiedSnapshot) -> List[List[str]]:
+        """
+        Get the occupied keys each network overlaps.
+        
+        With the vectorized backend, the networks are first checked against
+        the interval index all at once, and only the ones that overlap
+        something are matched to the entries they overlap.
+        """
+        if not (networks and self.settings.vectorized_backend and vectorized.available()):
+            return snapshot.find_overlaps(networks)
+        
+        starts, ends = vectorized.bounds([(int(network.network_address), int(network.broadcast_address)) for network in networks])
+        mask = vectorized.overlap_mask(starts, ends, *snapshot.index.bounds())
+        overlapping = [i for i, overlaps in enumerate(mask.tolist()) if overlaps]
+        
+        overlaps: List[List[str]] = [[] for _ in networks]
+        if overlapping:
+            for i, keys in zip(overlapping, snapshot.find_overlaps([networks[i] for i in overlapping])):
+                overlaps[i] = keys
+        return overlaps
+    
+    @metrics.instrumented("get_free_subnets")
+    def get_free_subnets(self, subnet_size: int, required_range: str, limit: Optional[int] = None) -> List[str]:
+        """
+        List every free aligned subnet of a given size in a range, lowest first.
+        
+        Uses the vectorized backend when NumPy is installed and enabled.
+        
+        Args:
+            subnet_size: The subnet prefix length
+            required_range: The range identifier
+            limit: Maximum number of subnets to return (None for all)
+            
+        Returns:
+            List[str]: Free subnet CIDR strings
+        """
+        main_range = self._get_range(required_range)
+        if not main_range.prefixlen <= subnet_size <= main_range.max_prefixlen:
+            raise ValueError(f"Invalid subnet size /{subnet_size} for range {main_range}")
+        if limit is not None and limit < 0:
+            raise ValueError("Limit cannot be negative")
         
-        self.git_manager.clone_or_pull()
-        occupied = self._load_occupied_cidrs()
+        snapshot = self.storage.read_snapshot()
+        with metrics.phase("search"):
+            gaps = snapshot.index.free_ranges(main_range)
         
-        # Find and delete the CIDR
-        key_to_delete = None
-        for key, cidr in occupied.items():
-            if cidr == cidr_block:
-                key_to_delete = key
-                break
+        # Enumerating and formatting the blocks of the gaps
+        with metrics.phase("serialize"):
+            if self.settings.vectorized_backend and vectorized.available():
+                gap_starts, gap_ends = vectorized.bounds(gaps)
+                starts = vectorized.aligned_free_blocks(gap_starts, gap_ends, subnet_size, limit)
+                subnets = vectorized.format_networks(starts, subnet_size)
+            else:
+                subnets = list(islice(self._iter_aligned_blocks(gaps, subnet_size), limit))
         
-        if key_to_delete is None:
-            return f"CIDR {cidr_block} not found in occupied list"
+        logger.info(f"Found {len(subnets)} free /{subnet_size} subnets in {main_range}")
+        return subnets
+    
+    @staticmethod
+    def _iter_aligned_blocks(gaps: List[Tuple[int, int]], subnet_size: int) -> Iterator[str]:
+        size = 1 << (32 - subnet_size)
+        for start, end in gaps:
+            block = (start + size - 1) // size * size
+            while block + size - 1 <= end:
+                yield f"{IPv4Address(block)}/{subnet_size}"
+                block += size
+    
+    @metrics.instrumented("get_fragmentation")
+    def get_fragmentation(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Measure the free-space fragmentation of every range in addresses-range.json.
         
-        # Delete the entry
-        del occupied[key_to_delete]
+        Returns:
+            Dict[str, Dict[str, Any]]: Per range key - its network, free
+                addresses, the largest free aligned block and the fragmentation
+                score (1 - largest free block / free addresses)
+        """
+        ranges = {range_key: IPv4Network(network) for range_key, network in self._load_address_ranges().items()}
         
-        # Save changes
-        self._save_occupied_cidrs(occupied)
+        snapshot = self.storage.read_snapshot()
+        with metrics.phase("search"):
+            gaps = {range_key: snapshot.index.free_ranges(network) for range_key, network in ranges.items()}
         
-        # Commit and push
-        commit_message = f"Deleted CIDR {cidr_block}"
-        self.git_manager.push_changes(commit_message)
+        result = {}
+        for range_key, network in ranges.items():
+            free, largest, score = fragmentation(gaps[range_key])
+            metrics.FRAGMENTATION.set(round(score, 6), range=range_key)
+            result[range_key] = {
+                "network": str(network),
+                "free_addresses": free,
+                "largest_free_block": f"/{33 - largest.bit_length()}" if largest else None,
+                "largest_free_addresses": largest,
+                "fragmentation": round(score, 6)
+            }
         
-        logger.info(f"Successfully deleted CIDR {cidr_block}")
-        return f"CIDR {cidr_block} deleted successfully (key: {key_to_delete})"
+        logger.info(f"Measured fragmentation of {len(result)} ranges")
+        return result
     
+    @metrics.instrumented("get_largest_free_blocks")
+    def get_largest_free_blocks(self, count: int = 10, free_limit: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Find the largest free aligned blocks of every range in addresses-range.json.
+        
+        One sweep over the free gaps of each range splits them into maximal
+        free CIDRs - aligned blocks that cannot be extended - and picks the
+        largest of those, so what still fits is known without probing each size.
+        
+        Args:
+            count: Number of largest blocks to return per range
+            free_limit: Maximum number of maximal free CIDRs to list per range (None for all)
+            
+        Returns:
+            Dict[str, Dict[str, Any]]: Per range key - its network, the largest
+                free blocks (largest first, then lowest), and the maximal free
+                CIDRs in address order with their total count
+        """
+        if count < 0 or (free_limit is not None and free_limit < 0):
+            raise ValueError("Count and limit cannot be negative")
+        ranges = {range_key: IPv4Network(network) for range_key, network in self._load_address_ranges().items()}
+        
+        snapshot = self.storage.read_snapshot()
+        with metrics.phase("search"):
+            gaps = {range_key: snapshot.index.free_ranges(network) for range_key, network in ranges.items()}
+        
+        result = {}
+        with metrics.phase("serialize"):
+            for range_key, network in ranges.items():
+                blocks = [block for start, end in gaps[range_key] for block in aligned_blocks(start, end)]
+                largest = heapq.nsmallest(count, blocks, key=lambda block: (block[1], block[0]))
+                result[range_key] = {
+                    "network": str(network),
+                    "largest": [format_cidr(start, prefix) for start, prefix in largest],
+                    "free_cidr_count": len(blocks),
+                    "free_cidrs": [format_cidr(start, prefix) for start, prefix in islice(blocks, free_limit)]
+                }
+        
+        logger.info(f"Found the largest free blocks of {len(result)} ranges")
+        return result
+    
+    @metrics.instrumented("get_statistics")
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        Get utilization statistics of the occupied list.
+        
+        The counts are kept up to date as mutations are applied to the cached
+        snapshot, so they are only computed from scratch when a new version of
+        the occupied list is loaded. The cached snapshot is used without
+        syncing while its last sync is at most statistics_max_age_seconds old.
+        
+        Returns:
+            Dict[str, Any]: Total allocations, counts by range and by subnet
+                size, the most recent allocation, and per-range address usage
+        """
+        ranges = {range_key: IPv4Network(network) for range_key, network in self._load_address_ranges().items()}
+        
+        snapshot = self.storage.cached_snapshot(self.settings.statistics_max_age_seconds)
+        with metrics.phase("search"):
+            statistics = snapshot.usage(ranges).summary()
+        
+        logger.info(f"Retrieved statistics of {statistics['total_allocated']} occupied CIDRs")
+        return statistics
+    
+    @metrics.instrumented("delete_cidr_from_list")
+    def delete_cidr_from_list(self, cidr_block: str) -> str:
+        """
+        Delete a CIDR block from the occupied list.
+        
+        Args:
+            cidr_block: The CIDR block to delete
+            
+        Returns:
+            str: Success or error message
+        """
+        if not self._is_valid_cidr(cidr_block, strict=False):
+            raise ValueError(f"Invalid CIDR format: {cidr_block}")
+        
+        def delete(snapshot: OccupiedSnapshot):
+            # Find and delete the CIDR, however it is spelled
+            key_to_delete = snapshot.find_cidr(cidr_block)
+            
+            if key_to_delete is None:
+                return f"CIDR {cidr_block} not found in occupied list", []
+            
+            # Delete the entry
+            snapshot.remove(key_to_delete)
+            
+            logger.info(f"Deleting CIDR {cidr_block}")
+            return f"CIDR {cidr_block} deleted successfully (key: {key_to_delete})", [f"Deleted CIDR {cidr_block}"]
+        
+        return self.commit_coalescer.submit(delete)
+    
+    @metrics.instrumented("manually_add_cidr")
     def manually_add_cidr(self, cidr_block: str, reason: str) -> str:
         """
         Manually add a CIDR block to the occupied list.
@@ -317,37 +1131,105 @@ class CIDRService:
         if not self._is_valid_cidr(cidr_block):
             return "Invalid CIDR format"
         
-        if self._check_cidr_overlap(cidr_block):
-            return "CIDR overlaps with existing allocation"
+        def add(snapshot: OccupiedSnapshot):
+            if self._check_cidr_overlap(cidr_block, snapshot):
+                return "CIDR overlaps with existing allocation", []
+            
+            # Create new entry
+            timestamp = int(time.time())
+            key = f"{reason}-{timestamp}"
+            snapshot.add(key, cidr_block)
+            
+            logger.info(f"Manually adding CIDR {cidr_block} for reason '{reason}'")
+            return "CIDR added successfully", [f"Manually added CIDR {cidr_block} for {reason}"]
         
-        self.git_manager.clone_or_pull()
-        occupied = self._load_occupied_cidrs()
+        return self.commit_coalescer.submit(add)
+
+class SubnetService:
+    """Service for subnet calculations."""
+    
+    def __init__(self):
+        self.settings = get_settings()
+    
+    def _parse_subnet_request(self, subnet_size: int, cidr: str) -> IPv4Network:
+        """Validate a subnet calculation request and return the parsed source network."""
+        try:
+            network = IPv4Network(cidr)
+        except ValueError as e:
+            raise ValueError(f"Invalid CIDR format '{cidr}': {e}")
         
-        # Create new entry
-        timestamp = int(time.time())
-        key = f"{reason}-{timestamp}"
-        occupied[key] = cidr_block
+        if subnet_size <= network.prefixlen:
+            raise ValueError(
+                f"Subnet size /{subnet_size} must be larger than source CIDR prefix /{network.prefixlen}"
+            )
         
-        # Save changes
-        self._save_occupied_cidrs(occupied)
+        if subnet_size > 30:
+            raise ValueError("Subnet size cannot be larger than /30")
         
-        # Commit and push
-        commit_message = f"Manually added CIDR {cidr_block} for {reason}"
-        self.git_manager.push_changes(commit_message)
+        return network
+    
+    def count_subnets(self, subnet_size: int, cidr: str) -> int:
+        """
+        Count the subnets of a given size in a CIDR block without generating them.
         
-        logger.info(f"Successfully added CIDR {cidr_block} manually for reason '{reason}'")
-        return "CIDR added successfully"
-
-class SubnetService:
-    """Service for subnet calculations."""
+        Raises:
+            ValueError: If CIDR is invalid or subnet size is inappropriate
+        """
+        network = self._parse_subnet_request(subnet_size, cidr)
+        return 1 << (subnet_size - network.prefixlen)
+    
+    def iter_subnets_from_cidr(self, subnet_size: int, cidr: str,
+                               offset: int = 0, limit: Optional[int] = None) -> Iterator[str]:
+        """
+        Lazily generate the subnets of a given size from a CIDR block.
+        
+        Subnets are computed arithmetically, so skipping to an offset is free and
+        memory stays constant however many subnets the block holds.
+        
+        Args:
+            subnet_size: Target subnet prefix length
+            cidr: Source CIDR block
+            offset: Number of leading subnets to skip
+            limit: Maximum number of subnets to generate (None for all)
+            
+        Returns:
+            Iterator[str]: Subnet CIDR strings in address order
+            
+        Raises:
+            ValueError: If CIDR is invalid, subnet size is inappropriate or
+                offset/limit are negative
+        """
+        network = self._parse_subnet_request(subnet_size, cidr)
+        start, end = self._page_bounds(network, subnet_size, offset, limit)
+        return self._generate_subnets(network, subnet_size, start, end)
     
-    def get_subnets_from_cidr(self, subnet_size: int, cidr: str) -> List[str]:
+    @staticmethod
+    def _page_bounds(network: IPv4Network, subnet_size: int, offset: int, limit: Optional[int]) -> Tuple[int, int]:
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError("Offset and limit cannot be negative")
+        
+        total = 1 << (subnet_size - network.prefixlen)
+        end = total if limit is None else min(total, offset + limit)
+        return min(offset, end), end
+    
+    @staticmethod
+    def _generate_subnets(network: IPv4Network, subnet_size: int, start: int, end: int) -> Iterator[str]:
+        step = 1 << (32 - subnet_size)
+        base = int(network.network_address)
+        for i in range(start, end):
+            yield f"{IPv4Address(base + i * step)}/{subnet_size}"
+    
+    @metrics.instrumented("get_subnets_from_cidr")
+    def get_subnets_from_cidr(self, subnet_size: int, cidr: str,
+                              offset: int = 0, limit: Optional[int] = None) -> List[str]:
         """
         Calculate all subnets of a given size from a CIDR block.
         
         Args:
             subnet_size: Target subnet prefix length
             cidr: Source CIDR block
+            offset: Number of leading subnets to skip
+            limit: Maximum number of subnets to return (None for all)
             
         Returns:
             List[str]: List of subnet CIDR strings
@@ -355,25 +1237,14 @@ class SubnetService:
         Raises:
             ValueError: If CIDR is invalid or subnet size is inappropriate
         """
-        try:
-            network = IPv4Network(cidr)
-        except ValueError as e:
-            raise ValueError(f"Invalid CIDR format '{cidr}': {e}")
+        network = self._parse_subnet_request(subnet_size, cidr)
+        start, end = self._page_bounds(network, subnet_size, offset, limit)
         
-        if subnet_size <= network.prefixlen:
-            raise ValueError(
-                f"Subnet size /{subnet_size} must be larger than source CIDR prefix /{network.prefixlen}"
-            )
-        
-        if subnet_size > 30:
-            raise ValueError("Subnet size cannot be larger than /30")
-        
-        subnets = []
-        try:
-            for subnet in network.subnets(new_prefix=subnet_size):
-                subnets.append(str(subnet))
-        except ValueError as e:
-            raise ValueError(f"Cannot create /{subnet_size} subnets from {cidr}: {e}")
+        if self.settings.vectorized_backend and vectorized.available():
+            starts = vectorized.subnet_starts(network, subnet_size, start, end - start)
+            subnets = vectorized.format_networks(starts, subnet_size)
+        else:
+            subnets = list(self._generate_subnets(network, subnet_size, start, end))
         
         logger.info(f"Generated {len(subnets)} subnets of size /{subnet_size} from {cidr}")
         return subnets
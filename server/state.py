@@ -0,0 +1,435 @@
+"""
+Pre-parsed, cached view of the occupied CIDR list.
+
+A snapshot is tied to the repository version it was loaded from, so the
+occupied file only has to be read and parsed again when a pull actually
+brings in a new version of it. Mutations are applied in place to keep it in
+step with the file that gets committed - on a copy, since read requests use
+the last committed snapshot without any lock. Its indexes are built lazily
+by whichever request needs them first, and are only published to the
+snapshot once complete.
+
+Entries are held column-wise in file order: network starts and prefix
+lengths in typed arrays, reason and timestamp in small slotted records.
+The allocation indexes, overlap checks and listings all read from these
+columns, so no IPv4Network object is kept per entry.
+"""
+
+import logging
+from array import array
+from ipaddress import IPv4Address, IPv4Network, summarize_address_range
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from allocator import BuddyAllocator, IntervalIndex, overlapping_pairs
+from usage import UsageStatistics
+
+logger = logging.getLogger(__name__)
+
+# Prefix length stored for entries whose CIDR could not be parsed
+INVALID_PREFIX = 0xFF
+
+def reason_from_key(key: str) -> str:
+    """Strip the timestamp suffix from an occupied key to get its reason."""
+    return key.rsplit('-', 1)[0] if '-' in key else key
+
+def normalize_cidr(cidr: str) -> str:
+    """
+    Canonical spelling of a CIDR, so that e.g. 10.0.0.0/024 and 10.0.0.5/24
+    both map to 10.0.0.0/24. Unparseable values are returned unchanged.
+    """
+    try:
+        return str(IPv4Network(cidr.strip(), strict=False))
+    except ValueError:
+        return cidr
+
+def format_cidr(start: int, prefix: int) -> str:
+    """Format an integer network start and prefix length as a CIDR string."""
+    return f"{start >> 24}.{(start >> 16) & 0xFF}.{(start >> 8) & 0xFF}.{start & 0xFF}/{prefix}"
+
+def _parse_canonical(cidr: str) -> Optional[Tuple[int, int]]:
+    """Parse a CIDR written exactly as format_cidr would write it, else None."""
+    try:
+        address, prefix = cidr.split('/')
+        a, b, c, d = map(int, address.split('.'))
+        length = int(prefix)
+    except ValueError:
+        return None
+
+    start = (a << 24) | (b << 16) | (c << 8) | d
+    if not (0 <= min(a, b, c, d) and max(a, b, c, d) <= 0xFF and 0 <= length <= 32):
+        return None
+    if start & ((1 << (32 - length)) - 1) or format_cidr(start, length) != cidr:
+        return None
+    return start, length
+
+def parse_cidr(cidr: str) -> Tuple[int, int]:
+    """
+    Parse a CIDR into its integer network start and prefix length.
+
+    Canonically written CIDRs are parsed directly; anything else goes through
+    IPv4Network, so exactly the same values are accepted.
+
+    Raises:
+        ValueError: If the value is not a valid CIDR or has host bits set
+    """
+    parsed = _parse_canonical(cidr)
+    if parsed is None:
+        network = IPv4Network(cidr)
+        parsed = int(network.network_address), network.prefixlen
+    return parsed
+
+class OccupiedRecord:
+    """Reason and timestamp of an occupied entry, i.e. its key split in two."""
+
+    __slots__ = ("reason", "timestamp", "raw")
+
+    def __init__(self, reason: str, timestamp: Union[int, str, None], raw: Optional[str] = None):
+        """
+        Args:
+            reason: Allocation reason
+            timestamp: Key suffix - an int when it is a plain number, None if the key has none
+            raw: The CIDR as written in the file, only kept when it is not canonical
+        """
+        self.reason = reason
+        self.timestamp = timestamp
+        self.raw = raw
+
+    @classmethod
+    def from_key(cls, key: str) -> "OccupiedRecord":
+        """Split a reason-timestamp key into a record."""
+        if '-' not in key:
+            return cls(key, None)
+        reason, suffix = key.rsplit('-', 1)
+        if suffix.isascii() and suffix.isdigit() and str(int(suffix)) == suffix:
+            return cls(reason, int(suffix))
+        return cls(reason, suffix)
+
+    @property
+    def key(self) -> str:
+        return self.reason if self.timestamp is None else f"{self.reason}-{self.timestamp}"
+
+class OccupiedSnapshot:
+    """Occupied CIDRs in compact columnar form, together with their allocation indexes."""
+
+    def __init__(self, occupied: Dict[str, str], head: Optional[str] = None, version: Optional[str] = None):
+        """
+        Args:
+            occupied: Dictionary of reason-timestamp keys to CIDR values
+            head: Commit SHA the snapshot was loaded at (git storage only)
+            version: Storage version the snapshot was loaded at - the blob SHAs
+                of the occupied file and its journal for git storage
+        """
+        self.head = head
+        self.version = version
+
+        # One row per entry, in file order. A removed entry leaves a tombstone
+        # (a None record) until enough of them pile up to compact the columns,
+        # so the row positions and indexes stay valid across removals
+        self._starts = array('I')
+        self._prefixes = array('B')
+        self._records: List[Optional[OccupiedRecord]] = []
+        self._tombstones = 0
+        for key, cidr in occupied.items():
+            self._append(OccupiedRecord.from_key(key), cidr, strict=False)
+
+        # Built lazily; row positions are rebuilt after compaction shifts them
+        self._positions: Optional[Dict[str, int]] = None
+        self._index: Optional[IntervalIndex] = None
+        self._buddy_allocators: Dict[str, BuddyAllocator] = {}
+        self._usage: Optional[UsageStatistics] = None
+
+        # Keys in file order for each reason and each normalized CIDR. The
+        # lists are replaced rather than modified, so copies can share them
+        self._reason_keys: Optional[Dict[str, List[str]]] = None
+        self._cidr_keys: Optional[Dict[str, List[str]]] = None
+
+        # ("add" | "remove", key, cidr) for every mutation not yet committed
+        self._changes: List[Tuple[str, str, str]] = []
+
+    def __getstate__(self) -> Dict[str, object]:
+        # Only the columns - indexes are rebuilt lazily and pending changes stay with their writer
+        self._compact()
+        return {
+            "head": self.head,
+            "version": self.version,
+            "starts": self._starts,
+            "prefixes": self._prefixes,
+            "reasons": [record.reason for record in self._records],
+            "timestamps": [record.timestamp for record in self._records],
+            "raw": {i: record.raw for i, record in enumerate(self._records) if record.raw is not None}
+        }
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        self.__init__({}, state["head"], state["version"])
+        self._starts = state["starts"]
+        self._prefixes = state["prefixes"]
+        self._records = list(map(OccupiedRecord, state["reasons"], state["timestamps"]))
+        for i, raw in state["raw"].items():
+            self._records[i].raw = raw
+
+    def __len__(self) -> int:
+        return len(self._records) - self._tombstones
+
+    def copy(self) -> "OccupiedSnapshot":
+        """
+        Independent copy to apply mutations to, leaving this snapshot as it is.
+
+        The indexes built so far are copied along, not rebuilt.
+        """
+        other = OccupiedSnapshot({}, self.head, self.version)
+        other._starts = self._starts[:]
+        other._prefixes = self._prefixes[:]
+        # Records are never modified once appended, so they are shared
+        other._records = self._records[:]
+        other._tombstones = self._tombstones
+
+        positions, index, usage = self._positions, self._index, self._usage
+        reason_keys, cidr_keys = self._reason_keys, self._cidr_keys
+        if positions is not None:
+            other._positions = dict(positions)
+        if index is not None:
+            other._index = index.copy()
+        other._buddy_allocators = {
+            range_key: allocator.copy() for range_key, allocator in list(self._buddy_allocators.items())
+        }
+        if usage is not None:
+            other._usage = usage.copy(other._usage_entries)
+        if reason_keys is not None:
+            other._reason_keys = dict(reason_keys)
+        if cidr_keys is not None:
+            other._cidr_keys = dict(cidr_keys)
+        return other
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._key_positions()
+
+    def _append(self, record: OccupiedRecord, cidr: str, strict: bool = True) -> None:
+        parsed = _parse_canonical(cidr)
+        if parsed is None:
+            # Not written canonically, so keep the spelling for listing and saving
+            record.raw = cidr
+            try:
+                parsed = parse_cidr(cidr)
+            except ValueError:
+                if strict:
+                    raise
+                # Kept as written so listing never fails on a malformed entry
+                parsed = 0, INVALID_PREFIX
+        start, prefix = parsed
+
+        self._starts.append(start)
+        self._prefixes.append(prefix)
+        self._records.append(record)
+
+    def _rows(self) -> Iterator[int]:
+        """Positions of the live rows, in file order."""
+        if not self._tombstones:
+            return iter(range(len(self._records)))
+        return (i for i, record in enumerate(self._records) if record is not None)
+
+    def _compact(self) -> None:
+        """Drop the tombstones left by removals, shifting the rows after them."""
+        if not self._tombstones:
+            return
+        rows = list(self._rows())
+        self._starts = array('I', (self._starts[i] for i in rows))
+        self._prefixes = array('B', (self._prefixes[i] for i in rows))
+        self._records = [self._records[i] for i in rows]
+        self._tombstones = 0
+        self._positions = None
+
+    def _key_positions(self) -> Dict[str, int]:
+        if self._positions is None:
+            self._positions = {self._records[i].key: i for i in self._rows()}
+        return self._positions
+
+    def _cidr_at(self, i: int) -> str:
+        raw = self._records[i].raw
+        return raw if raw is not None else format_cidr(self._starts[i], self._prefixes[i])
+
+    def _interval_at(self, i: int) -> Tuple[int, int]:
+        prefix = self._prefixes[i]
+        if prefix == INVALID_PREFIX:
+            raise ValueError(f"Invalid CIDR in occupied list: {self._records[i].raw}")
+        start = self._starts[i]
+        return start, start + (1 << (32 - prefix)) - 1
+
+    def get(self, key: str) -> Optional[str]:
+        """Get the CIDR of an occupied key, if it exists."""
+        i = self._key_positions().get(key)
+        return None if i is None else self._cidr_at(i)
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        """Iterate over (key, CIDR) pairs in file order."""
+        for i in self._rows():
+            yield self._records[i].key, self._cidr_at(i)
+
+    def to_dict(self) -> Dict[str, str]:
+        """Occupied entries as the key to CIDR mapping stored in the occupied file."""
+        return dict(self.items())
+
+    def take_changes(self) -> List[Tuple[str, str, str]]:
+        """Get the ("add" | "remove", key, cidr) changes made since the last call, in order."""
+        changes, self._changes = self._changes, []
+        return changes
+
+    def intervals(self) -> List[Tuple[int, int]]:
+        """(start, end) address interval of every entry, in file order."""
+        return [self._interval_at(i) for i in self._rows()]
+
+    @property
+    def index(self) -> IntervalIndex:
+        """Interval index over all occupied networks."""
+        if self._index is None:
+            self._index = IntervalIndex(self.intervals())
+        return self._index
+
+    def find_reason(self, reason: str) -> Optional[str]:
+        """Get the first occupied key allocated for a reason, if any."""
+        if self._reason_keys is None:
+            reason_keys: Dict[str, List[str]] = {}
+            for i in self._rows():
+                record = self._records[i]
+                reason_keys.setdefault(record.reason, []).append(record.key)
+            self._reason_keys = reason_keys
+
+        keys = self._reason_keys.get(reason)
+        return keys[0] if keys else None
+
+    def find_cidr(self, cidr: str) -> Optional[str]:
+        """Get the first occupied key holding a CIDR, under any equivalent spelling."""
+        if self._cidr_keys is None:
+            cidr_keys: Dict[str, List[str]] = {}
+            for key, occupied_cidr in self.items():
+                cidr_keys.setdefault(normalize_cidr(occupied_cidr), []).append(key)
+            self._cidr_keys = cidr_keys
+
+        keys = self._cidr_keys.get(normalize_cidr(cidr))
+        return keys[0] if keys else None
+
+    def find_overlaps(self, networks: List[IPv4Network]) -> List[List[str]]:
+        """Get the occupied keys each network overlaps, in file order."""
+        candidates = [(int(network.network_address), int(network.broadcast_address)) for network in networks]
+        rows = list(self._rows())
+        return [
+            [self._records[rows[i]].key for i in positions]
+            for positions in overlapping_pairs(candidates, [self._interval_at(i) for i in rows])
+        ]
+
+    def buddy_allocator(self, range_key: str, main_range: IPv4Network) -> BuddyAllocator:
+        """Get the buddy free lists for a range, building them on first use."""
+        allocator = self._buddy_allocators.get(range_key)
+        if allocator is None or allocator.main_range != main_range:
+            logger.info(f"Building buddy free lists for {main_range}")
+            allocator = BuddyAllocator(main_range, self.index)
+            self._buddy_allocators[range_key] = allocator
+        return allocator
+
+    def usage(self, ranges: Dict[str, IPv4Network]) -> UsageStatistics:
+        """Get the utilization statistics for a set of ranges, counting them on first use."""
+        if self._usage is None or self._usage.ranges != ranges:
+            logger.info(f"Counting utilization of {len(self)} entries")
+            self._usage = UsageStatistics(ranges, self._usage_entries)
+        return self._usage
+
+    def _free_ranges(self, network: IPv4Network) -> Optional[List[Tuple[int, int]]]:
+        """
+        Unoccupied intervals inside a network, for keeping the usage statistics in step.
+
+        Returns None, and drops the statistics so that they are counted again
+        on their next read, if a malformed entry keeps the index from being built.
+        """
+        try:
+            return self.index.free_ranges(network)
+        except ValueError:
+            self._usage = None
+            return None
+
+    def _usage_entries(self) -> Iterator[Tuple[int, int, Union[int, str, None], str]]:
+        for i in self._rows():
+            if self._prefixes[i] != INVALID_PREFIX:
+                yield self._starts[i], self._prefixes[i], self._records[i].timestamp, self._records[i].key
+
+    def add(self, key: str, cidr: str) -> None:
+        """
+        Add an occupied entry and reserve it in the indexes.
+
+        Raises:
+            ValueError: If the CIDR is not valid
+        """
+        if key in self:
+            self.remove(key)
+
+        self._append(OccupiedRecord.from_key(key), cidr)
+        self._changes.append(("add", key, cidr))
+        if self._positions is not None:
+            self._positions[key] = len(self._records) - 1
+        if self._reason_keys is not None:
+            self._append_key(self._reason_keys, reason_from_key(key), key)
+        if self._cidr_keys is not None:
+            self._append_key(self._cidr_keys, normalize_cidr(cidr), key)
+
+        record = self._records[-1]
+        network = IPv4Network((self._starts[-1], self._prefixes[-1]))
+        if self._usage is not None:
+            # Only the parts of the network no other entry covers add to the used addresses
+            used = self._free_ranges(network)
+            if used is not None:
+                self._usage.add(self._starts[-1], self._prefixes[-1], record.timestamp, key, used)
+
+        if self._index is not None:
+            self._index.add(network)
+        for allocator in self._buddy_allocators.values():
+            allocator.reserve(network)
+
+    @staticmethod
+    def _append_key(index: Dict[str, List[str]], name: str, key: str) -> None:
+        index[name] = index.get(name, []) + [key]
+
+    @staticmethod
+    def _discard_key(index: Dict[str, List[str]], name: str, key: str) -> None:
+        keys = [other for other in index[name] if other != key]
+        if keys:
+            index[name] = keys
+        else:
+            del index[name]
+
+    def remove(self, key: str) -> None:
+        """Remove an occupied entry and release whatever it alone was covering."""
+        positions = self._key_positions()
+        i = positions.pop(key)
+        cidr = self._cidr_at(i)
+        start, prefix = self._starts[i], self._prefixes[i]
+        timestamp = self._records[i].timestamp
+
+        self._records[i] = None
+        self._tombstones += 1
+        self._changes.append(("remove", key, cidr))
+
+        if self._reason_keys is not None:
+            self._discard_key(self._reason_keys, reason_from_key(key), key)
+        if self._cidr_keys is not None:
+            self._discard_key(self._cidr_keys, normalize_cidr(cidr), key)
+        if prefix != INVALID_PREFIX:
+            network = IPv4Network((start, prefix))
+            if self._index is not None and not self._index.overlapping:
+                # Nothing else covers any of the network, so it is simply cut out
+                self._index.remove(network)
+                freed = [(start, int(network.broadcast_address))]
+            else:
+                # Other entries may still cover part of the removed network
+                self._index = None
+                freed = []
+                if self._buddy_allocators or self._usage is not None:
+                    freed = self._free_ranges(network) or []
+
+            if self._usage is not None:
+                self._usage.remove(start, prefix, timestamp, key, freed)
+            for allocator in self._buddy_allocators.values():
+                for free_start, free_end in freed:
+                    for free_network in summarize_address_range(IPv4Address(free_start), IPv4Address(free_end)):
+                        allocator.release(free_network)
+
+        # Compacting costs a pass over the rows, so only once they are mostly tombstones
+        if self._tombstones > max(len(self._records) // 2, 1024):
+            self._compact()
@@ -0,0 +1,260 @@
+"""
+Storage backends for the occupied CIDR state.
+
+CIDRService works against a StorageBackend: it loads an OccupiedSnapshot,
+applies its mutations to it in place and hands it back to be committed.
+Writers are given a copy of the last committed snapshot, which only replaces
+it once committed, so read requests can use it without waiting for them.
+The git backend (GitStorage in services.py) keeps the state as a JSON file
+in a GitHub repository. SQLiteStorage keeps it in a local database instead,
+for deployments that do not need the repository as a shared source of truth.
+"""
+
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, ContextManager, Optional, Tuple
+
+import metrics
+from state import OccupiedSnapshot, parse_cidr, reason_from_key
+
+logger = logging.getLogger(__name__)
+
+class StorageConflictError(Exception):
+    """Raised when another writer committed first, so the changes have to be re-applied."""
+
+class StorageBackend(ABC):
+    """
+    Where the occupied state is loaded from and committed to.
+
+    Writers hold the backend's lock from loading a snapshot to write to until
+    it is committed. Snapshots for reading are never mutated, so readers do
+    not take the lock.
+    """
+
+    lock: threading.RLock
+
+    @abstractmethod
+    def read_snapshot(self) -> OccupiedSnapshot:
+        """Get a snapshot fresh enough to serve a read-only request. It must not be mutated."""
+
+    def cached_snapshot(self, max_age: float) -> OccupiedSnapshot:
+        """
+        Get the last loaded snapshot without checking for newer versions,
+        as long as it was synced at most max_age seconds ago.
+
+        Backends that can check their version cheaply just return a fresh snapshot.
+        """
+        return self.read_snapshot()
+
+    @abstractmethod
+    def write_snapshot(self, retry: bool = False) -> OccupiedSnapshot:
+        """
+        Get a copy of the latest snapshot to apply mutations to.
+
+        Args:
+            retry: The last commit hit a StorageConflictError, so whatever the
+                other writer committed has to be loaded first
+        """
+
+    def mutation_lock(self) -> ContextManager:
+        """
+        Lock held, after the backend's lock, from loading a snapshot to
+        write to until it is committed. Backends whose state is shared by
+        several processes on one host return a lock that covers them all.
+        """
+        return nullcontext()
+
+    @abstractmethod
+    def commit(self, snapshot: OccupiedSnapshot, message: str) -> None:
+        """
+        Persist the changes applied to a snapshot, which then replaces the
+        one served to read requests.
+
+        Raises:
+            StorageConflictError: If another writer committed since the snapshot was loaded
+            Exception: If the changes could not be stored
+        """
+
+class SharedSnapshotCache:
+    """
+    Parsed occupied state shared by the worker processes of one deployment.
+
+    The worker that loads or commits a new version of the occupied file
+    pickles its snapshot to a file next to the clone; the other workers then
+    unpickle it instead of parsing the occupied file and journal again. The
+    file is keyed by commit SHA and occupied version, so it is ignored as soon
+    as either moves on.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Cache file, replaced atomically on every store
+        """
+        self.path = Path(path)
+
+    def load(self, head: Optional[str], version: Optional[str]) -> Optional[Tuple[OccupiedSnapshot, Any]]:
+        """
+        Get the cached snapshot if it was stored at the given commit or occupied version.
+
+        Returns:
+            Optional[Tuple[OccupiedSnapshot, Any]]: The snapshot and the extra
+                state stored with it, or None if there is no usable entry
+        """
+        if head is None:
+            return None
+        try:
+            with open(self.path, "rb") as file:
+                # The key comes first, so a stale entry is rejected without unpickling the snapshot
+                cached_head, cached_version = pickle.load(file)
+                if cached_head != head and (version is None or cached_version != version):
+                    return None
+                snapshot, extra = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable snapshot cache {self.path}: {e}")
+            return None
+
+        snapshot.head = head
+        return snapshot, extra
+
+    def store(self, snapshot: OccupiedSnapshot, extra: Any = None) -> None:
+        """Replace the cached snapshot, along with any extra state the backend needs."""
+        temporary = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            with open(temporary, "wb") as file:
+                pickle.dump((snapshot.head, snapshot.version), file, pickle.HIGHEST_PROTOCOL)
+                pickle.dump((snapshot, extra), file, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.path)
+        except Exception as e:
+            # Every worker can still load the occupied file itself
+            logger.warning(f"Failed to store snapshot cache {self.path}: {e}")
+            temporary.unlink(missing_ok=True)
+
+class SQLiteStorage(StorageBackend):
+    """Occupied state in a local SQLite database, one row per entry."""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Database file, created if it does not exist
+        """
+        self.path = path
+        self.lock = threading.RLock()
+
+        # Serializes transactions on the connection, which readers share with the writer
+        self._connection_lock = threading.Lock()
+
+        # Last committed state, never mutated - see StorageBackend
+        self._snapshot: Optional[OccupiedSnapshot] = None
+
+        try:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            # Autocommit mode - transactions are started explicitly in commit()
+            self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS occupied (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT NOT NULL UNIQUE,
+                    reason TEXT NOT NULL,
+                    cidr TEXT NOT NULL,
+                    range_start INTEGER,
+                    range_end INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS occupied_reason ON occupied (reason);
+                CREATE INDEX IF NOT EXISTS occupied_range ON occupied (range_start, range_end);
+                CREATE TABLE IF NOT EXISTS meta (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    version INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO meta (id, version) VALUES (1, 0);
+            """)
+        except sqlite3.Error as e:
+            logger.error(f"Database error occurred: {e}")
+            raise Exception(f"Failed to open occupied CIDRs database {path}: {e}")
+
+        logger.info(f"Using SQLite storage at {path}")
+
+    def _current_version(self) -> int:
+        return self._connection.execute("SELECT version FROM meta WHERE id = 1").fetchone()[0]
+
+    def _load_snapshot(self) -> OccupiedSnapshot:
+        """Get the snapshot for the current database version, reusing the cached one if possible."""
+        with self._connection_lock:
+            try:
+                # One read transaction, so the rows match the version read with them
+                self._connection.execute("BEGIN")
+                try:
+                    version = self._current_version()
+                    snapshot = self._snapshot
+                    if snapshot is None or snapshot.version != version:
+                        logger.info(f"Loading occupied CIDRs at database version {version}")
+                        with metrics.phase("load"):
+                            rows = self._connection.execute("SELECT key, cidr FROM occupied ORDER BY id")
+                            snapshot = OccupiedSnapshot(dict(rows), version=version)
+                finally:
+                    self._connection.execute("COMMIT")
+            except sqlite3.Error as e:
+                logger.error(f"Database error occurred: {e}")
+                raise Exception(f"Failed to load occupied CIDRs from database: {e}")
+
+            self._snapshot = snapshot
+            metrics.OCCUPIED_ENTRIES.set(len(snapshot))
+            return snapshot
+
+    def read_snapshot(self) -> OccupiedSnapshot:
+        return self._load_snapshot()
+
+    def write_snapshot(self, retry: bool = False) -> OccupiedSnapshot:
+        # Every load checks the version, so a retry needs nothing extra
+        return self._load_snapshot().copy()
+
+    def commit(self, snapshot: OccupiedSnapshot, message: str) -> None:
+        changes = snapshot.take_changes()
+        with self._connection_lock, metrics.phase("save"):
+            try:
+                self._connection.execute("BEGIN IMMEDIATE")
+                try:
+                    version = self._current_version()
+                    if version != snapshot.version:
+                        raise StorageConflictError("Database changed since the snapshot was loaded")
+
+                    for action, key, cidr in changes:
+                        if action == "remove":
+                            self._connection.execute("DELETE FROM occupied WHERE key = ?", (key,))
+                            continue
+                        try:
+                            start, prefix = parse_cidr(cidr)
+                            end = start + (1 << (32 - prefix)) - 1
+                        except ValueError:
+                            start = end = None
+                        self._connection.execute(
+                            "INSERT INTO occupied (key, reason, cidr, range_start, range_end) VALUES (?, ?, ?, ?, ?)",
+                            (key, reason_from_key(key), cidr, start, end)
+                        )
+
+                    self._connection.execute("UPDATE meta SET version = ? WHERE id = 1", (version + 1,))
+                    self._connection.execute("COMMIT")
+                except BaseException:
+                    if self._connection.in_transaction:
+                        self._connection.execute("ROLLBACK")
+                    raise
+            except StorageConflictError:
+                logger.warning(f"Commit rejected, database has new changes: {message}")
+                raise
+            except Exception as e:
+                logger.error(f"Failed to commit changes: {e}")
+                raise Exception(f"Failed to commit changes to database: {e}")
+
+            snapshot.version = version + 1
+            self._snapshot = snapshot
+            metrics.OCCUPIED_ENTRIES.set(len(snapshot))
+            logger.info(f"Changes committed successfully: {message}")
@@ -0,0 +1,54 @@
+"""
+Background synchronization of the occupied CIDRs repository.
+
+Instead of pulling from the remote at the start of every request, a daemon
+thread fetches on a fixed interval and fast-forwards the local checkout.
+Read requests are then served from the local snapshot.
+"""
+
+import logging
+import threading
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class RepositorySyncer:
+    """Periodically fetches the repository in a background thread."""
+    
+    def __init__(self, git_manager, interval: float):
+        """
+        Args:
+            git_manager: The GitManager whose checkout is kept in sync
+            interval: Seconds between fetches
+        """
+        self.git_manager = git_manager
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self) -> None:
+        """Start the background sync thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        
+        logger.info(f"Starting background repository sync every {self.interval}s")
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="repository-sync", daemon=True)
+        self._thread.start()
+    
+    def stop(self) -> None:
+        """Stop the background sync thread and wait for it to finish."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        logger.info("Background repository sync stopped")
+    
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.git_manager.sync()
+            except Exception as e:
+                # Keep serving the last good snapshot and try again next round
+                logger.error(f"Background repository sync failed: {e}")
+            self._stop_event.wait(self.interval)
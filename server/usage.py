@@ -0,0 +1,152 @@
+"""
+Utilization statistics of the occupied CIDR list.
+
+Counting allocations and used addresses means a pass over every entry, so
+it is done once per snapshot. After that, OccupiedSnapshot.add and remove
+keep the counts in step, and reading them costs nothing more than the
+number of ranges.
+
+Entries may overlap, so used addresses are counted over the union of the
+entries: on add and remove, the snapshot passes the intervals that actually
+became used or free, which it gets from its interval index.
+"""
+
+from collections import Counter
+from datetime import datetime, timezone
+from ipaddress import IPv4Network
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from allocator import IntervalIndex
+
+class UsageStatistics:
+    """Allocation counts and used addresses per range and prefix length."""
+
+    def __init__(self, ranges: Dict[str, IPv4Network], entries: Callable[[], Iterable[Tuple[int, int, Any, str]]]):
+        """
+        Args:
+            ranges: Range keys and networks from addresses-range.json
+            entries: Yields (start, prefix, timestamp, key) of every occupied
+                entry with a valid CIDR, timestamp being the key's suffix
+        """
+        self.ranges = dict(ranges)
+        self._bounds = {
+            range_key: (int(network.network_address), int(network.broadcast_address))
+            for range_key, network in self.ranges.items()
+        }
+        self.total = 0
+        self.by_range: Counter = Counter()
+        self.used: Counter = Counter()
+        self.by_prefix: Counter = Counter()
+        self._latest: Optional[Tuple[int, str]] = None
+        self._latest_stale = False
+        self._entries = entries
+
+        intervals = []
+        for start, prefix, timestamp, key in entries():
+            self._count(start, prefix, 1)
+            self._track_latest(timestamp, key)
+            intervals.append((start, start + (1 << (32 - prefix)) - 1))
+        self._use(zip(*IntervalIndex(intervals).bounds()), 1)
+
+    def add(self, start: int, prefix: int, timestamp: Any, key: str, used: Iterable[Tuple[int, int]]) -> None:
+        """
+        Count a new occupied entry.
+
+        Args:
+            used: The (start, end) intervals of the entry that no other entry covered
+        """
+        self._count(start, prefix, 1)
+        self._use(used, 1)
+        self._track_latest(timestamp, key)
+
+    def remove(self, start: int, prefix: int, timestamp: Any, key: str, freed: Iterable[Tuple[int, int]]) -> None:
+        """
+        Stop counting a removed occupied entry.
+
+        Args:
+            freed: The (start, end) intervals of the entry that no other entry still covers
+        """
+        self._count(start, prefix, -1)
+        self._use(freed, -1)
+        if self._latest is not None and self._latest[1] == key:
+            # Found again on the next read, which only happens when the newest entry goes
+            self._latest_stale = True
+
+    def copy(self, entries: Callable[[], Iterable[Tuple[int, int, Any, str]]]) -> "UsageStatistics":
+        """Independent copy for a copy of the snapshot, whose entries it reads from then on."""
+        other = UsageStatistics.__new__(UsageStatistics)
+        other.__dict__.update(self.__dict__)
+        other.by_range = self.by_range.copy()
+        other.used = self.used.copy()
+        other.by_prefix = self.by_prefix.copy()
+        other._entries = entries
+        return other
+
+    def _track_latest(self, timestamp: Any, key: str) -> None:
+        if isinstance(timestamp, int) and (self._latest is None or timestamp >= self._latest[0]):
+            self._latest = timestamp, key
+
+    def _count(self, start: int, prefix: int, sign: int) -> None:
+        self.total += sign
+        self.by_prefix[prefix] += sign
+        end = start + (1 << (32 - prefix)) - 1
+        for range_key, (range_start, range_end) in self._bounds.items():
+            if start <= range_end and end >= range_start:
+                self.by_range[range_key] += sign
+
+    def _use(self, intervals: Iterable[Tuple[int, int]], sign: int) -> None:
+        """Add (or with sign -1, subtract) the addresses of disjoint intervals to the ranges they fall in."""
+        for start, end in intervals:
+            for range_key, (range_start, range_end) in self._bounds.items():
+                if start <= range_end and end >= range_start:
+                    self.used[range_key] += sign * (min(end, range_end) - max(start, range_start) + 1)
+
+    def latest(self) -> Optional[Tuple[int, str]]:
+        """(timestamp, key) of the most recent allocation, if any entry has a timestamp."""
+        if self._latest_stale:
+            self._latest = max(
+                ((timestamp, key) for _, _, timestamp, key in self._entries() if isinstance(timestamp, int)),
+                default=None
+            )
+            self._latest_stale = False
+        return self._latest
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Statistics in the shape of the CIDRStatistics model.
+
+        Returns:
+            Dict[str, Any]: Total allocations, counts by range and by subnet
+                size, the most recent allocation, and per-range address usage
+        """
+        latest = self.latest()
+        last_allocation = None
+        if latest is not None:
+            try:
+                last_allocation = datetime.fromtimestamp(latest[0], timezone.utc).isoformat()
+            except (OverflowError, OSError, ValueError):
+                # Not a Unix timestamp after all
+                last_allocation = str(latest[0])
+
+        return {
+            "total_allocated": self.total,
+            "by_range": {range_key: self.by_range[range_key] for range_key in self.ranges},
+            "by_subnet_size": {f"/{prefix}": count for prefix, count in sorted(self.by_prefix.items()) if count},
+            "last_allocation": last_allocation,
+            "last_allocation_key": latest[1] if latest is not None else None,
+            "ranges": [self.range_info(range_key) for range_key in self.ranges]
+        }
+
+    def range_info(self, range_key: str) -> Dict[str, Any]:
+        """Allocations and used versus free addresses of one range, in the shape of the RangeInfo model."""
+        network = self.ranges[range_key]
+        used = self.used[range_key]
+        return {
+            "range_id": range_key,
+            "network": str(network),
+            "total_addresses": network.num_addresses,
+            "allocated": self.by_range[range_key],
+            "used_addresses": used,
+            "free_addresses": network.num_addresses - used,
+            "utilization": round(used / network.num_addresses * 100, 4)
+        }
@@ -0,0 +1,84 @@
+"""
+Optional NumPy backend for bulk subnet and overlap math.
+
+Networks are represented as uint32 start/end arrays so that enumerating
+subnets, checking overlaps and listing free blocks happen a whole array at
+a time instead of one IPv4Network object at a time. NumPy is not a hard
+dependency - callers check available() and fall back to the pure-Python
+path when it is missing.
+"""
+
+from ipaddress import IPv4Network
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def available() -> bool:
+    """Check whether the vectorized backend can be used."""
+    return np is not None
+
+def subnet_starts(network: IPv4Network, prefix: int, offset: int = 0, limit: Optional[int] = None) -> "np.ndarray":
+    """Start addresses of the prefix-sized subnets of a network, optionally paged."""
+    total = 1 << (prefix - network.prefixlen)
+    end = total if limit is None else min(total, offset + limit)
+    step = 1 << (network.max_prefixlen - prefix)
+    indexes = np.arange(min(offset, end), end, dtype=np.uint64)
+    return (int(network.network_address) + indexes * step).astype(np.uint32)
+
+def format_networks(starts: "np.ndarray", prefix: int) -> List[str]:
+    """Format start addresses of a common prefix length as CIDR strings."""
+    starts = starts.astype(np.uint32, copy=False)
+    octets = [((starts >> shift) & 0xFF).tolist() for shift in (24, 16, 8, 0)]
+    return [f"{a}.{b}.{c}.{d}/{prefix}" for a, b, c, d in zip(*octets)]
+
+def bounds(intervals: Sequence[Tuple[int, int]]) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Split (start, end) pairs into uint32 start and end arrays."""
+    if not intervals:
+        return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint32)
+    array = np.asarray(intervals, dtype=np.uint32)
+    return array[:, 0], array[:, 1]
+
+def overlap_mask(starts: "np.ndarray", ends: "np.ndarray",
+                 occupied_starts: Sequence[int], occupied_ends: Sequence[int]) -> "np.ndarray":
+    """
+    For every candidate interval, whether it overlaps any occupied interval.
+
+    The occupied intervals must be sorted and disjoint, as kept by IntervalIndex.
+    """
+    if len(occupied_starts) == 0:
+        return np.zeros(len(starts), dtype=bool)
+    occupied_starts = np.asarray(occupied_starts, dtype=np.uint32)
+    occupied_ends = np.asarray(occupied_ends, dtype=np.uint32)
+
+    # First occupied interval ending at or after each candidate's start
+    index = np.searchsorted(occupied_ends, starts, side="left")
+    inside = index < len(occupied_starts)
+    mask = np.zeros(len(starts), dtype=bool)
+    mask[inside] = occupied_starts[index[inside]] <= ends[inside]
+    return mask
+
+def aligned_free_blocks(gap_starts: "np.ndarray", gap_ends: "np.ndarray", prefix: int,
+                        limit: Optional[int] = None) -> "np.ndarray":
+    """Start addresses of every aligned prefix-sized block that fits in the free gaps."""
+    size = 1 << (32 - prefix)
+    gap_starts = gap_starts.astype(np.int64)
+    gap_ends = gap_ends.astype(np.int64)
+
+    first = (gap_starts + size - 1) // size * size
+    counts = np.maximum((gap_ends + 1 - first) // size, 0)
+    if limit is not None:
+        # Only the gaps needed to reach the limit have to be expanded
+        keep = np.searchsorted(np.cumsum(counts), limit, side="left") + 1
+        first, counts = first[:keep], counts[:keep]
+
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.uint32)
+
+    # Position of each block within its gap, then offset from that gap's first block
+    offsets = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    blocks = (np.repeat(first, counts) + offsets * size).astype(np.uint32)
+    return blocks if limit is None else blocks[:limit]
@@ -0,0 +1,99 @@
+import os
+import random
+import sys
+import unittest
+from ipaddress import IPv4Network
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server"))
+
+from allocator import IntervalIndex  # noqa: E402
+from state import OccupiedSnapshot  # noqa: E402
+
+
+def scan_first_fit(main_range, prefix, occupied):
+    """The original allocation: walk every subnet and take the first one nothing overlaps."""
+    for subnet in main_range.subnets(new_prefix=prefix):
+        if not any(subnet.overlaps(network) for network in occupied):
+            return subnet
+    return None
+
+
+def random_occupied(rng, main_range, count):
+    """Random aligned networks in and around a range, some of them overlapping."""
+    occupied = []
+    for _ in range(count):
+        prefix = rng.randint(main_range.prefixlen - 1, 30)
+        start = int(main_range.network_address) + rng.randrange(main_range.num_addresses)
+        occupied.append(IPv4Network((start >> (32 - prefix) << (32 - prefix), prefix)))
+    return occupied
+
+
+class TestIntervalIndexFirstFit(unittest.TestCase):
+    def test_matches_subnet_scan(self):
+        """first_fit returns exactly what the subnet scan returns"""
+        rng = random.Random(1)
+        main_range = IPv4Network("192.168.0.0/20")
+        for _ in range(100):
+            occupied = random_occupied(rng, main_range, rng.randint(0, 40))
+            index = IntervalIndex((int(n.network_address), int(n.broadcast_address)) for n in occupied)
+            for prefix in (20, 22, 24, 26, 28, 30):
+                self.assertEqual(index.first_fit(main_range, prefix), scan_first_fit(main_range, prefix, occupied),
+                                 f"/{prefix} with {occupied}")
+
+    def test_matches_subnet_scan_after_adds(self):
+        """Networks added to a built index are accounted for like in a fresh scan"""
+        rng = random.Random(2)
+        main_range = IPv4Network("10.10.0.0/22")
+        occupied = random_occupied(rng, main_range, 5)
+        index = IntervalIndex((int(n.network_address), int(n.broadcast_address)) for n in occupied)
+        for _ in range(150):
+            prefix = rng.choice([24, 26, 27, 28, 30])
+            expected = scan_first_fit(main_range, prefix, occupied)
+            self.assertEqual(index.first_fit(main_range, prefix), expected)
+            if expected is None:
+                break
+            index.add(expected)
+            occupied.append(expected)
+
+    def test_full_range(self):
+        """A fully occupied range has no first fit"""
+        index = IntervalIndex([(int(IPv4Network("10.0.0.0/8").network_address), int(IPv4Network("10.0.0.0/8").broadcast_address))])
+        self.assertIsNone(index.first_fit(IPv4Network("10.1.0.0/16"), 24))
+
+    def test_invalid_prefix(self):
+        """Prefixes that cannot be carved out of the range are rejected"""
+        index = IntervalIndex()
+        with self.assertRaises(ValueError):
+            index.first_fit(IPv4Network("10.1.0.0/16"), 8)
+        with self.assertRaises(ValueError):
+            index.first_fit(IPv4Network("10.1.0.0/16"), 33)
+
+
+class TestBuddyAllocator(unittest.TestCase):
+    def test_peek_matches_first_fit_after_adds_and_deletes(self):
+        """The buddy free lists give the first-fit block through allocations and deletions"""
+        rng = random.Random(3)
+        main_range = IPv4Network("172.16.0.0/20")
+        for _ in range(10):
+            occupied = {f"seed{i}-{i}": str(network) for i, network in enumerate(random_occupied(rng, main_range, 10))}
+            snapshot = OccupiedSnapshot(occupied)
+            buddy = snapshot.buddy_allocator("172", main_range)
+            for step in range(80):
+                if occupied and rng.random() < 0.4:
+                    key = rng.choice(list(occupied))
+                    snapshot.remove(key)
+                    del occupied[key]
+                else:
+                    network = buddy.peek(rng.choice([22, 24, 26, 28, 30]))
+                    if network is not None:
+                        snapshot.add(f"step{step}-{step}", str(network))
+                        occupied[f"step{step}-{step}"] = str(network)
+
+                networks = [IPv4Network(cidr) for cidr in occupied.values()]
+                for prefix in (20, 22, 24, 26, 28, 30):
+                    self.assertEqual(buddy.peek(prefix), scan_first_fit(main_range, prefix, networks),
+                                     f"/{prefix} with {sorted(occupied.values())}")
+
+
+if __name__ == '__main__':
+    unittest.main()
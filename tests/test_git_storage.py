@@ -0,0 +1,193 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server"))
+
+import config  # noqa: E402
+from services import GitStorage, PushRejectedError  # noqa: E402
+
+
+def git(*args, cwd=None):
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout
+
+
+def create_remote(directory, files):
+    """A bare repository whose main branch has one commit with the given files."""
+    remote = os.path.join(directory, "remote.git")
+    work = os.path.join(directory, "seed")
+    git("init", "--bare", "-b", "main", remote)
+    git("init", "-b", "main", work)
+    for path, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(work, path)) or work, exist_ok=True)
+        with open(os.path.join(work, path), "w") as f:
+            f.write(content)
+    git("add", ".", cwd=work)
+    git("commit", "-m", "Seed", cwd=work)
+    git("push", remote, "main", cwd=work)
+    return remote
+
+
+def remote_file(remote, path):
+    return git("--git-dir", remote, "show", f"main:{path}")
+
+
+class GitStorageTestCase(unittest.TestCase):
+    """Runs GitStorage against a bare repository in a temporary directory instead of GitHub."""
+
+    occupied_file = "occupied-range.json"
+    settings = {}
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.remote = create_remote(self.directory.name, self.seed_files())
+        self.clones = 0
+
+        environment = mock.patch.dict(os.environ, {
+            "storage_backend": "git",
+            "remote_url": self.remote,
+            "occupied_file": self.occupied_file,
+            "log_level": "WARNING",
+            **self.settings
+        })
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.addCleanup(config.get_settings.cache_clear)
+
+    def seed_files(self):
+        return {self.occupied_file: json.dumps({"seed-1700000000": "10.0.0.0/24"})}
+
+    def storage(self):
+        """A GitStorage on a clone of its own, like a separate replica."""
+        self.clones += 1
+        with mock.patch.dict(os.environ, {"git_dest_dir": os.path.join(self.directory.name, f"clone{self.clones}")}):
+            config.get_settings.cache_clear()
+            return GitStorage()
+
+    def commit(self, storage, adds=(), removes=()):
+        snapshot = storage.write_snapshot()
+        for key in removes:
+            snapshot.remove(key)
+        for key, cidr in adds:
+            snapshot.add(key, cidr)
+        storage.commit(snapshot, "Test changes")
+        return snapshot
+
+
+class TestJournal(GitStorageTestCase):
+    settings = {"occupied_format": "journal", "journal_compact_entries": "3"}
+
+    def journal(self):
+        return [json.loads(line) for line in remote_file(self.remote, f"{self.occupied_file}.journal").splitlines()]
+
+    def test_changes_are_appended(self):
+        """Changes go to the journal and leave the occupied file as it was"""
+        storage = self.storage()
+        self.commit(storage, adds=[("web-1700000001", "10.0.1.0/24")])
+        self.commit(storage, adds=[("db-1700000002", "10.0.2.0/24")], removes=["web-1700000001"])
+
+        self.assertEqual(json.loads(remote_file(self.remote, self.occupied_file)), {"seed-1700000000": "10.0.0.0/24"})
+        self.assertEqual(self.journal(), [
+            {"op": "add", "key": "web-1700000001", "cidr": "10.0.1.0/24"},
+            {"op": "remove", "key": "web-1700000001", "cidr": "10.0.1.0/24"},
+            {"op": "add", "key": "db-1700000002", "cidr": "10.0.2.0/24"},
+        ])
+
+    def test_replay(self):
+        """Another clone replays the journal on top of the occupied file, re-added keys last"""
+        storage = self.storage()
+        self.commit(storage, adds=[("web-1700000001", "10.0.1.0/24")])
+        self.commit(storage, removes=["seed-1700000000"])
+        self.commit(storage, adds=[("seed-1700000000", "10.0.3.0/24")])
+
+        snapshot = self.storage().read_snapshot()
+        self.assertEqual(list(snapshot.items()), [("web-1700000001", "10.0.1.0/24"), ("seed-1700000000", "10.0.3.0/24")])
+        self.assertEqual(snapshot.find_reason("seed"), "seed-1700000000")
+
+    def test_compaction(self):
+        """Going past journal_compact_entries rewrites the occupied file and empties the journal"""
+        storage = self.storage()
+        self.commit(storage, adds=[("web-1700000001", "10.0.1.0/24"), ("db-1700000002", "10.0.2.0/24")])
+        self.assertEqual(len(self.journal()), 2)
+
+        self.commit(storage, adds=[("cache-1700000003", "10.0.3.0/24"), ("queue-1700000004", "10.0.4.0/24")])
+        expected = {
+            "seed-1700000000": "10.0.0.0/24",
+            "web-1700000001": "10.0.1.0/24",
+            "db-1700000002": "10.0.2.0/24",
+            "cache-1700000003": "10.0.3.0/24",
+            "queue-1700000004": "10.0.4.0/24"
+        }
+        self.assertEqual(json.loads(remote_file(self.remote, self.occupied_file)), expected)
+        self.assertEqual(self.journal(), [])
+
+        # Journaling starts over on top of the compacted file
+        self.commit(storage, removes=["db-1700000002"])
+        self.assertEqual(len(self.journal()), 1)
+        del expected["db-1700000002"]
+        self.assertEqual(self.storage().read_snapshot().to_dict(), expected)
+
+
+class TestNestedOccupiedFile(GitStorageTestCase):
+    occupied_file = "dir/sub/occupied.json"
+
+    def seed_files(self):
+        return {**super().seed_files(), "dir/sub/other.txt": "other\n", "dir/notes.txt": "notes\n", "README.md": "readme\n"}
+
+    def test_commit_replaces_only_the_occupied_file(self):
+        """The commit rewrites the nested file, keeps its neighbours, and has the seed commit as parent"""
+        seed = git("--git-dir", self.remote, "rev-parse", "main").strip()
+        self.commit(self.storage(), adds=[("web-1700000001", "10.0.1.0/24")])
+
+        self.assertEqual(json.loads(remote_file(self.remote, self.occupied_file)),
+                         {"seed-1700000000": "10.0.0.0/24", "web-1700000001": "10.0.1.0/24"})
+        self.assertEqual(remote_file(self.remote, "dir/sub/other.txt"), "other\n")
+        self.assertEqual(remote_file(self.remote, "dir/notes.txt"), "notes\n")
+        self.assertEqual(remote_file(self.remote, "README.md"), "readme\n")
+        self.assertEqual(git("--git-dir", self.remote, "rev-parse", "main^").strip(), seed)
+        git("--git-dir", self.remote, "fsck", "--strict")
+
+    def test_missing_directories_are_created(self):
+        """Without the occupied file at HEAD, the commit adds it along with its directories"""
+        os.remove(os.path.join(self.directory.name, "seed", self.occupied_file))
+        git("commit", "-am", "Remove occupied file", cwd=os.path.join(self.directory.name, "seed"))
+        git("push", self.remote, "main", cwd=os.path.join(self.directory.name, "seed"))
+
+        with mock.patch.dict(os.environ, {"occupied_file": "new/dir/occupied.json"}):
+            self.commit(self.storage(), adds=[("web-1700000001", "10.0.1.0/24")])
+
+        self.assertEqual(json.loads(remote_file(self.remote, "new/dir/occupied.json")), {"web-1700000001": "10.0.1.0/24"})
+        self.assertEqual(remote_file(self.remote, "dir/sub/other.txt"), "other\n")
+        git("--git-dir", self.remote, "fsck", "--strict")
+
+    def test_rejected_push(self):
+        """A commit on top of a stale HEAD is rejected by the remote and goes through once re-applied"""
+        first, second = self.storage(), self.storage()
+        stale = first.write_snapshot()
+        stale.add("web-1700000001", "10.0.1.0/24")
+        self.commit(second, adds=[("db-1700000002", "10.0.1.0/24")])
+
+        with self.assertRaises(PushRejectedError):
+            first.commit(stale, "Stale changes")
+        self.assertNotIn("web-1700000001", first.read_snapshot())
+
+        snapshot = first.write_snapshot(retry=True)
+        snapshot.add("web-1700000001", "10.0.2.0/24")
+        first.commit(snapshot, "Retried changes")
+        self.assertEqual(json.loads(remote_file(self.remote, self.occupied_file)), {
+            "seed-1700000000": "10.0.0.0/24",
+            "db-1700000002": "10.0.1.0/24",
+            "web-1700000001": "10.0.2.0/24"
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
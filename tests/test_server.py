@@ -177,6 +177,66 @@ class TestAPI(unittest.TestCase):
         final_data = json.loads(final_response.text)
         self.assertNotIn(test_cidr, final_data.values(), f"CIDR {test_cidr} should be removed")
 
+    def test_6_get_cidr_batch_output_validation(self):
+        """TEST 6: get_cidr_batch - one valid CIDR per item, repeated reasons reuse their CIDR"""
+        print(f"\n🧪 TEST 6: get-cidr-batch API (output = per-item results)")
+
+        stamp = datetime.now().strftime('%H%M%S%f')
+        items = [
+            {"subnet_size": 26, "required_range": "10", "reason": f"batch-a-{stamp}"},
+            {"subnet_size": 27, "required_range": "10", "reason": f"batch-b-{stamp}"},
+            {"subnet_size": 26, "required_range": "10", "reason": f"batch-a-{stamp}"},
+        ]
+        response = requests.post("http://localhost:8000/get-cidr-batch", json={"items": items})
+        self.assertEqual(response.status_code, 200)
+
+        results = response.json()["results"]
+        print(f"   Output: {results}")
+        self.assertEqual(len(results), 3, f"Expected 3 results, got {len(results)}")
+
+        first, second, repeated = results
+        for result, prefix in ((first, 26), (second, 27)):
+            self.assertIsNone(result["error"], f"Unexpected error: {result['error']}")
+            self.assertFalse(result["reused"])
+            self.assertEqual(IPv4Network(result["cidr"]).prefixlen, prefix)
+        self.assertFalse(IPv4Network(first["cidr"]).overlaps(IPv4Network(second["cidr"])),
+                         "Batch allocations must not overlap")
+        self.assertTrue(repeated["reused"], "Repeated reason should reuse the existing CIDR")
+        self.assertEqual(repeated["cidr"], first["cidr"])
+
+        print(f"   ✅ PASSED: Batch allocated non-overlapping CIDRs")
+
+        # Clean up
+        for result in (first, second):
+            requests.get(f"http://localhost:8000/delete-cidr-from-list?cidr_deletion={result['cidr']}")
+
+    def test_7_check_conflicts_output_validation(self):
+        """TEST 7: check_conflicts - occupied CIDRs conflict, invalid candidates are reported"""
+        print(f"\n🧪 TEST 7: check-conflicts API (output = conflicting CIDRs with their occupied keys)")
+
+        reason = f"conflict-{datetime.now().strftime('%H%M%S%f')}"
+        response = requests.get(f"http://localhost:8000/get-cidr?subnet_size=28&requiredrange=10&reason={reason}")
+        self.assertEqual(response.status_code, 200)
+        cidr = response.text.strip()
+
+        body = f"{cidr}\n{IPv4Network(cidr).supernet(new_prefix=24)}\nnot-a-cidr\n"
+        headers = {"Content-Type": "text/plain"}
+        response = requests.post("http://localhost:8000/check-conflicts", data=body, headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+        result = response.json()
+        print(f"   Output: {result}")
+        self.assertEqual(result["checked"], 3)
+        self.assertEqual(result["invalid"], ["not-a-cidr"])
+        self.assertEqual(len(result["conflicts"]), 2, "Both the CIDR and its supernet should conflict")
+        for conflict in result["conflicts"]:
+            self.assertIn(cidr, conflict["overlaps"].values())
+
+        print(f"   ✅ PASSED: Conflicts reported with their occupied keys")
+
+        # Clean up
+        requests.get(f"http://localhost:8000/delete-cidr-from-list?cidr_deletion={cidr}")
+
 
 if __name__ == '__main__':
     # Run with: python -m pytest tests/test_server.py -v
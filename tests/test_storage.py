@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server"))
+
+from storage import SQLiteStorage, StorageConflictError  # noqa: E402
+
+
+class TestSQLiteStorage(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "occupied.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_commit_is_read_back(self):
+        """Committed adds and removes are seen by a fresh storage on the same database"""
+        storage = SQLiteStorage(self.path)
+        snapshot = storage.write_snapshot()
+        snapshot.add("web-1700000000", "10.0.0.0/24")
+        snapshot.add("db-1700000001", "10.0.1.0/24")
+        storage.commit(snapshot, "add two")
+
+        snapshot = storage.write_snapshot()
+        snapshot.remove("web-1700000000")
+        storage.commit(snapshot, "remove one")
+
+        self.assertEqual(storage.read_snapshot().to_dict(), {"db-1700000001": "10.0.1.0/24"})
+        self.assertEqual(SQLiteStorage(self.path).read_snapshot().to_dict(), {"db-1700000001": "10.0.1.0/24"})
+
+    def test_write_snapshot_is_a_copy(self):
+        """Mutations are not visible to readers until committed"""
+        storage = SQLiteStorage(self.path)
+        snapshot = storage.write_snapshot()
+        snapshot.add("web-1700000000", "10.0.0.0/24")
+        self.assertEqual(storage.read_snapshot().to_dict(), {})
+
+        storage.commit(snapshot, "add")
+        self.assertEqual(storage.read_snapshot().to_dict(), {"web-1700000000": "10.0.0.0/24"})
+
+    def test_conflict(self):
+        """A commit on top of a version another writer already replaced is rejected and not applied"""
+        first = SQLiteStorage(self.path)
+        second = SQLiteStorage(self.path)
+
+        stale = first.write_snapshot()
+        stale.add("web-1700000000", "10.0.0.0/24")
+
+        snapshot = second.write_snapshot()
+        snapshot.add("db-1700000001", "10.0.0.0/24")
+        second.commit(snapshot, "other writer")
+
+        with self.assertRaises(StorageConflictError):
+            first.commit(stale, "stale")
+        self.assertEqual(first.read_snapshot().to_dict(), {"db-1700000001": "10.0.0.0/24"})
+
+        # Re-applied on the latest version, it goes through
+        snapshot = first.write_snapshot(retry=True)
+        snapshot.add("web-1700000000", "10.0.1.0/24")
+        first.commit(snapshot, "retried")
+        self.assertEqual(second.read_snapshot().to_dict(),
+                         {"db-1700000001": "10.0.0.0/24", "web-1700000000": "10.0.1.0/24"})
+
+
+if __name__ == '__main__':
+    unittest.main()